@@ -4,12 +4,32 @@ from openai import OpenAI
 import requests
 import json
 from dotenv import load_dotenv
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "code"))
+from llm_cache import cache_from_env  # noqa: E402
+from rate_limit import limiter_from_env, estimate_tokens  # noqa: E402
+
+MODEL = "gpt-5-mini"
+REASONING_EFFORT = "medium"
+CACHE = cache_from_env()
+LIMITER = limiter_from_env()
 
 
 def call_gpt5(system_prompt: str, user_prompt: str, image_path: str = None) -> str:
     """
     Call GPT-5 with optional image input using the official OpenAI client.
     """
+    image_bytes = None
+    if image_path:
+        with open(image_path, "rb") as f:
+            image_bytes = f.read()
+
+    key = CACHE.key(MODEL, system_prompt, user_prompt, image_bytes, REASONING_EFFORT)
+    cached = CACHE.lookup(key)
+    if cached is not None:
+        return cached
+
     input_payload = [
         {"role": "system", "content": [
             {"type": "input_text", "text": system_prompt}]},
@@ -26,12 +46,15 @@ def call_gpt5(system_prompt: str, user_prompt: str, image_path: str = None) -> s
             {"type": "input_image", "file_id": img_obj.id}
         )
 
-    response = client.responses.create(
-        model="gpt-5-mini",
+    response = LIMITER.call(
+        client.responses.create,
+        estimate_tokens(system_prompt, user_prompt),
+        model=MODEL,
         input=input_payload,
-        reasoning={"effort": "medium"}
+        reasoning={"effort": REASONING_EFFORT}
     )
 
+    CACHE.store(key, response.output_text, model=MODEL)
     return response.output_text
 
 
@@ -65,7 +88,7 @@ if __name__ == "__main__":
     GPT_API_KEY = os.getenv("GPT_API_KEY")
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
 
     with open("prompts/data-extraction.txt", "r", encoding="utf-8") as f:
         system_prompt = f.read()
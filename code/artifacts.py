@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+
+from PIL import Image, features
+
+# widths of the preview images written next to each chart, largest first
+THUMB_WIDTHS = (1024, 512, 256)
+
+
+def _save(im, path, fmt, **options):
+    # write then rename so a crash mid-write never leaves a torn image
+    tmp = f"{path}.{os.getpid()}.tmp"
+    im.save(tmp, fmt, **options)
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+
+def _exact_palette(im):
+    """
+    Convert an RGB image with at most 256 colors to a palette image with exactly those colors,
+    or return None when it has more.
+    """
+    colors = im.getcolors(maxcolors=256)
+    if colors is None:
+        return None
+    palette = [channel for _, rgb in colors for channel in rgb]
+    pal = Image.new("P", (1, 1))
+    pal.putpalette(palette + [0] * (768 - len(palette)))
+    return im.quantize(colors=len(colors), palette=pal, dither=Image.Dither.NONE)
+
+
+def optimize_png(path, im=None) -> dict:
+    """
+    Rewrite a PNG losslessly: drop an alpha channel that is fully opaque, use an exact palette
+    when the chart has 256 colors or fewer, and let zlib search for the smallest encoding.
+    `im` is the already decoded image, if the caller has it.
+    """
+    before = os.path.getsize(path)
+    if im is None:
+        with Image.open(path) as im:
+            im.load()
+    if im.mode == "RGBA" and im.getextrema()[3] == (255, 255):
+        im = im.convert("RGB")
+    palette = _exact_palette(im) if im.mode == "RGB" else None
+    if palette is not None:
+        im = palette
+    tmp = f"{path}.{os.getpid()}.tmp"
+    im.save(tmp, "PNG", optimize=True)
+    after = os.path.getsize(tmp)
+    if after >= before:
+        # never make things worse; keep what matplotlib wrote
+        os.remove(tmp)
+        return {"png_bytes": before, "raw_png_bytes": before, "palette": False}
+    os.replace(tmp, path)
+    return {"png_bytes": after, "raw_png_bytes": before, "palette": palette is not None}
+
+
+def encode_artifacts(path, webp=False, thumb_widths=THUMB_WIDTHS) -> dict:
+    """
+    Optimize a chart PNG in place and write the optional lossless WebP and the thumbnail pyramid
+    (<name>_w<width>.webp, or .png without WebP support) beside it. Returns paths and byte sizes.
+    """
+    stem = os.path.splitext(path)[0]
+    with Image.open(path) as im:
+        im.load()
+    info = optimize_png(path, im)
+
+    has_webp = features.check("webp")
+    if webp and has_webp:
+        info["webp_path"] = f"{stem}.webp"
+        info["webp_bytes"] = _save(im, info["webp_path"], "WEBP", lossless=True, method=4)
+
+    # each level is downsampled from the one above it, which is cheaper than starting from full size
+    thumbs = {}
+    level = im.convert("RGBA" if im.mode in ("RGBA", "LA", "P") else "RGB")
+    for width in sorted(thumb_widths, reverse=True):
+        if width >= level.width:
+            continue
+        level = level.resize((width, max(1, round(level.height * width / level.width))), Image.Resampling.LANCZOS)
+        thumb = f"{stem}_w{width}.{'webp' if has_webp else 'png'}"
+        if has_webp:
+            size = _save(level, thumb, "WEBP", quality=80, method=4)
+        else:
+            size = _save(level, thumb, "PNG", optimize=True)
+        thumbs[width] = {"path": thumb, "bytes": size}
+    info["thumbnails"] = thumbs
+    return info
+
+
+if __name__ == "__main__":
+    # python code/artifacts.py generated/*/*_design.png   (compacts existing charts in place)
+    total_before = total_after = 0
+    for fname in sys.argv[1:]:
+        info = encode_artifacts(fname)
+        total_before += info["raw_png_bytes"]
+        total_after += info["png_bytes"]
+        print(json.dumps({"file": fname, **{k: v for k, v in info.items() if k != "thumbnails"}}))
+    if total_before:
+        print(f"PNG bytes: {total_before} -> {total_after} ({round(100 * total_after / total_before)}%)")
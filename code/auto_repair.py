@@ -0,0 +1,386 @@
+import os
+import re
+import ast
+import json
+
+# old seaborn style names that matplotlib now ships under a "seaborn-v0_8-" prefix
+SEABORN_STYLES = {
+    "seaborn", "seaborn-bright", "seaborn-colorblind", "seaborn-dark", "seaborn-dark-palette",
+    "seaborn-darkgrid", "seaborn-deep", "seaborn-muted", "seaborn-notebook", "seaborn-paper",
+    "seaborn-pastel", "seaborn-poster", "seaborn-talk", "seaborn-ticks", "seaborn-white",
+    "seaborn-whitegrid",
+}
+
+# conventional aliases the generated code uses without always importing them
+KNOWN_IMPORTS = {
+    "np": "import numpy as np",
+    "plt": "import matplotlib.pyplot as plt",
+    "mpl": "import matplotlib as mpl",
+    "matplotlib": "import matplotlib",
+    "mpatches": "import matplotlib.patches as mpatches",
+    "patches": "from matplotlib import patches",
+    "pe": "import matplotlib.patheffects as pe",
+    "path_effects": "import matplotlib.patheffects as path_effects",
+    "mticker": "import matplotlib.ticker as mticker",
+    "ticker": "from matplotlib import ticker",
+    "gridspec": "from matplotlib import gridspec",
+    "Line2D": "from matplotlib.lines import Line2D",
+    "Rectangle": "from matplotlib.patches import Rectangle",
+    "Circle": "from matplotlib.patches import Circle",
+    "Ellipse": "from matplotlib.patches import Ellipse",
+    "FancyArrowPatch": "from matplotlib.patches import FancyArrowPatch",
+    "Patch": "from matplotlib.patches import Patch",
+    "math": "import math",
+    "textwrap": "import textwrap",
+}
+
+# the ways matplotlib reports a keyword it does not accept
+BAD_KWARG = re.compile(
+    r"unexpected keyword argument '(\w+)'|has no property '(\w+)'|keyword grid_(\w+) is not recognized")
+
+# calls that build a file path, for telling a savefig path from a buffer
+PATH_CALLS = {"join", "Path", "PurePath", "abspath", "realpath", "expanduser", "fspath", "str",
+              "with_suffix", "with_name", "joinpath"}
+
+# the string arguments of a call that installs packages, e.g. [sys.executable, "-m", "pip", "install", pkg]
+INSTALL = re.compile(r"\bpip\d?\b.*\binstall\b|\bensurepip\b")
+
+# keyword arguments matplotlib renamed, old name -> new name
+RENAMED_KWARGS = {
+    "b": "visible",
+    "labels": "tick_labels",
+    "linestyles": "linestyle",
+    "edgecolors": "edgecolor",
+}
+
+
+def _offset(source, lineno, col):
+    """
+    Turn an ast (lineno, col_offset) pair into an index into source.
+    """
+    lines = source.splitlines(keepends=True)
+    return sum(len(line) for line in lines[:lineno - 1]) + len(
+        lines[lineno - 1].encode("utf-8")[:col].decode("utf-8", errors="ignore"))
+
+
+def _splice(source, edits):
+    """
+    Apply (start_node_pos, end_node_pos, replacement) edits to source text.
+    Working on the text rather than ast.unparse keeps the script's comments and layout.
+    """
+    spans = sorted(
+        ((_offset(source, *start), _offset(source, *end), text) for start, end, text in edits),
+        reverse=True)
+    applied_from = len(source)
+    for start, end, text in spans:
+        # nested matches (e.g. int(int(x))) would overlap, keep only the outermost
+        if end > applied_from:
+            continue
+        source = source[:start] + text + source[end:]
+        applied_from = start
+    return source
+
+
+def _start(node):
+    return (node.lineno, node.col_offset)
+
+
+def _end(node):
+    return (node.end_lineno, node.end_col_offset)
+
+
+def _error_line(error, filename):
+    """
+    Line number of the innermost traceback frame inside the chart script.
+    """
+    frames = re.findall(r'File "([^"]+)", line (\d+)', error)
+    lines = [int(n) for f, n in frames if os.path.basename(f) == os.path.basename(filename)]
+    return lines[-1] if lines else None
+
+
+def _calls_on_line(tree, lineno):
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and lineno is not None and node.lineno <= lineno <= node.end_lineno:
+            yield node
+
+
+def fix_style_name(source, error, ctx):
+    edits = []
+    for node in ast.walk(ctx["tree"]):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr == "use" and node.args
+                and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)):
+            continue
+        name = node.args[0].value
+        if name in SEABORN_STYLES:
+            fixed = name.replace("seaborn", "seaborn-v0_8", 1)
+            edits.append((_start(node.args[0]), _end(node.args[0]), repr(fixed)))
+        elif name in error:
+            edits.append((_start(node.args[0]), _end(node.args[0]), repr("default")))
+    return _splice(source, edits) if edits else None
+
+
+def _add_imports(source, tree, imports):
+    """
+    Insert import lines at the top of the script, after a leading docstring / __future__ import.
+    """
+    body = tree.body
+    insert_at = 0
+    for node in body:
+        if (isinstance(node, ast.ImportFrom) and node.module == "__future__") or (
+                isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant)
+                and isinstance(node.value.value, str) and node is body[0]):
+            insert_at = node.end_lineno
+    lines = source.splitlines(keepends=True)
+    return "".join(lines[:insert_at]) + imports + "".join(lines[insert_at:])
+
+
+def _numpy_alias(tree):
+    """
+    The name the script imports numpy under, or None.
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name == "numpy":
+                    return alias.asname or "numpy"
+    return None
+
+
+def _with_numpy(source, tree, edits):
+    """
+    Apply edits written against `np`, first making sure the script has numpy as np.
+    """
+    alias = _numpy_alias(tree)
+    if alias not in (None, "np"):
+        edits = [(start, end, re.sub(r"\bnp\.", f"{alias}.", text)) for start, end, text in edits]
+    fixed = _splice(source, edits)
+    if alias is None:
+        fixed = _add_imports(fixed, ast.parse(fixed), "import numpy as np\n")
+    return fixed
+
+
+def fix_missing_import(source, error, ctx):
+    missing = [n for n in re.findall(r"NameError: name '(\w+)' is not defined", error)
+               if n in KNOWN_IMPORTS]
+    if not missing:
+        return None
+    imports = "".join(f"{KNOWN_IMPORTS[n]}\n" for n in dict.fromkeys(missing))
+    return _add_imports(source, ctx["tree"], imports)
+
+
+def fix_bad_kwarg(source, error, ctx):
+    names = re.findall(BAD_KWARG, error)
+    names = {next(n for n in groups if n) for groups in names}
+    lineno = _error_line(error, ctx["filename"])
+    for call in _calls_on_line(ctx["tree"], lineno):
+        args = list(call.args) + list(call.keywords)
+        args.sort(key=_start)
+        for i, kw in enumerate(args):
+            if not isinstance(kw, ast.keyword) or kw.arg not in names:
+                continue
+            if kw.arg in RENAMED_KWARGS:
+                new = f"{RENAMED_KWARGS[kw.arg]}={ast.get_source_segment(source, kw.value)}"
+                return _splice(source, [(_start(kw), _end(kw), new)])
+            # drop the argument together with the comma that separates it from its neighbour
+            if i + 1 < len(args):
+                return _splice(source, [(_start(kw), _start(args[i + 1]), "")])
+            if i > 0:
+                return _splice(source, [(_end(args[i - 1]), _end(kw), "")])
+            return _splice(source, [(_start(kw), _end(kw), "")])
+    return None
+
+
+def _is_nan(node):
+    return (isinstance(node, ast.Attribute) and node.attr in ("nan", "NaN", "NAN")
+            and isinstance(node.value, ast.Name) and node.value.id in ("np", "numpy", "math"))
+
+
+def fix_nan_compare(source, error, ctx):
+    edits = []
+    for node in ast.walk(ctx["tree"]):
+        if not (isinstance(node, ast.Compare) and len(node.ops) == 1
+                and isinstance(node.ops[0], (ast.Eq, ast.NotEq, ast.Is, ast.IsNot))):
+            continue
+        left, right = node.left, node.comparators[0]
+        if _is_nan(right):
+            value = left
+        elif _is_nan(left):
+            value = right
+        else:
+            continue
+        test = f"np.isnan({ast.get_source_segment(source, value)})"
+        if isinstance(node.ops[0], (ast.NotEq, ast.IsNot)):
+            test = f"~{test}"
+        edits.append((_start(node), _end(node), f"({test})"))
+    return _with_numpy(source, ctx["tree"], edits) if edits else None
+
+
+def _index_array(node):
+    """
+    Whether an expression is an index array: np.where(...)[0], np.nonzero(...)[0], np.flatnonzero(...)
+    and the like, which int() and float() only accept while they hold exactly one element.
+    """
+    if isinstance(node, ast.Subscript) and not isinstance(node.slice, ast.Slice):
+        node = node.value
+    return (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+            and node.func.attr in ("where", "nonzero", "flatnonzero", "argwhere"))
+
+
+def fix_array_to_scalar(source, error, ctx):
+    # the same lookup tends to be repeated all over a script, so fix every one of them in a
+    # single pass rather than one traceback (and one repair) at a time
+    lineno = _error_line(error, ctx["filename"])
+    on_line = set(_calls_on_line(ctx["tree"], lineno))
+    edits = []
+    for call in ast.walk(ctx["tree"]):
+        if not (isinstance(call, ast.Call) and isinstance(call.func, ast.Name) and call.func.id in ("int", "float")
+                and len(call.args) == 1 and not call.keywords):
+            continue
+        arg = call.args[0]
+        if call in on_line or _index_array(arg):
+            edits.append((_start(arg), _end(arg),
+                          f"np.asarray({ast.get_source_segment(source, arg)}).ravel()[0]"))
+    return _with_numpy(source, ctx["tree"], edits) if edits else None
+
+
+def _installs(call):
+    strings = [n.value for n in ast.walk(call) if isinstance(n, ast.Constant) and isinstance(n.value, str)]
+    return bool(INSTALL.search(" ".join(strings)))
+
+
+def fix_install_call(source, error, ctx):
+    # a runtime install fails without network access; with it gone, a missing package
+    # surfaces as a plain ImportError that the recoder can work around
+    edits = []
+    for node in ast.walk(ctx["tree"]):
+        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Call) and _installs(node.value):
+            edits.append((_start(node), _end(node), "pass"))
+        elif isinstance(node, ast.Assign) and isinstance(node.value, ast.Call) and _installs(node.value):
+            edits.append((_start(node.value), _end(node.value), "None"))
+    return _splice(source, edits) if edits else None
+
+
+def _path_like(node, tree, depth=0):
+    """
+    Whether a savefig target is a file path: a string, an f-string, os.path.join(...), Path(...)
+    and the like, or a name assigned one of those. Buffers (io.BytesIO(), open files) and
+    anything that cannot be told apart statically are not.
+    """
+    if depth > 3:
+        return False
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, str)
+    if isinstance(node, ast.JoinedStr):
+        return True
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Mod, ast.Div)):
+        return _path_like(node.left, tree, depth + 1) or _path_like(node.right, tree, depth + 1)
+    if isinstance(node, ast.Call):
+        func = node.func
+        name = func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", None)
+        if name in PATH_CALLS:
+            return True
+        return isinstance(func, ast.Attribute) and name == "format" and _path_like(func.value, tree, depth + 1)
+    if isinstance(node, ast.Name):
+        values = [a.value for a in ast.walk(tree) if isinstance(a, ast.Assign)
+                  and any(isinstance(t, ast.Name) and t.id == node.id for t in a.targets)]
+        return bool(values) and all(_path_like(v, tree, depth + 1) for v in values)
+    return False
+
+
+def fix_output_path(source, error, ctx):
+    edits = []
+    savers = ("savefig", "write_image")
+    for node in ast.walk(ctx["tree"]):
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr in savers and node.args
+                and _path_like(node.args[0], ctx["tree"])):
+            target = repr(ctx["image_fname"])
+            if ast.get_source_segment(source, node.args[0]) != target:
+                edits.append((_start(node.args[0]), _end(node.args[0]), target))
+    if edits:
+        return _splice(source, edits)
+    if "plt" in source:
+        # nothing saves the figure at all, so add the save the pipeline expects
+        return source.rstrip("\n") + (
+            f'\nplt.savefig({ctx["image_fname"]!r}, dpi=300, bbox_inches="tight")\n')
+    return None
+
+
+def retarget_output(source, image_fname):
+    """
+    Point every savefig / write_image call that saves to a file path at image_fname, e.g. to render a candidate beside the real output.
+    Source that does not parse is returned unchanged.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return source
+    return fix_output_path(source, "", {"tree": tree, "image_fname": image_fname}) or source
+
+
+# (rule name, stderr signature, fix); rules are tried in order and the first change wins
+RULES = [
+    ("style_name", re.compile(r"is not a valid package style|style names were removed"), fix_style_name),
+    ("missing_import", re.compile(r"NameError: name '\w+' is not defined"), fix_missing_import),
+    ("bad_kwarg", BAD_KWARG, fix_bad_kwarg),
+    ("nan_compare", re.compile(r"(?i)\bnan\b|truth value of an array"), fix_nan_compare),
+    ("array_to_scalar", re.compile(r"only (?:0-dimensional|length-1|size-1) arrays can be converted"), fix_array_to_scalar),
+    ("install_call", re.compile(r"CalledProcessError|No module named pip|\bpip\d?\b.*\binstall\b|ensurepip"),
+     fix_install_call),
+    ("output_path", re.compile(r"No such file or directory: '[^']*\.(?:png|svg|jpe?g|pdf)'|did not write"), fix_output_path),
+]
+
+
+class AutoRepair:
+    """
+    Deterministic fixes for mechanical chart-script failures, tried before the LLM recoder.
+    Hit rates per rule are kept in a small JSON file so the rule set can be grown where it pays off.
+    """
+
+    def __init__(self, stats_path=".auto_repair_stats.json", rules=RULES):
+        self.stats_path = stats_path
+        self.rules = rules
+        self.stats = {}
+        if os.path.exists(stats_path):
+            with open(stats_path, "r") as f:
+                self.stats = json.load(f)
+
+    def repair(self, source, error, filename, image_fname):
+        """
+        Return (new_source, rule_name) for the first rule that matches and changes the code, else None.
+        """
+        try:
+            tree = ast.parse(source)
+        except SyntaxError:
+            return None
+        ctx = {"tree": tree, "filename": filename, "image_fname": image_fname}
+
+        for name, signature, fix in self.rules:
+            if not signature.search(error):
+                continue
+            self._bump(name, "matched")
+            fixed = fix(source, error, ctx)
+            if fixed is None or fixed == source:
+                continue
+            self._bump(name, "applied")
+            return fixed, name
+        return None
+
+    def record(self, rule, success):
+        self._bump(rule, "succeeded" if success else "failed")
+
+    def _bump(self, rule, field):
+        counts = self.stats.setdefault(rule, {"matched": 0, "applied": 0, "succeeded": 0, "failed": 0})
+        counts[field] += 1
+
+    def save(self):
+        with open(self.stats_path, "w") as f:
+            json.dump(self.stats, f, indent=2)
+
+    def summary(self) -> str:
+        parts = []
+        for rule, c in sorted(self.stats.items()):
+            rate = c["succeeded"] / c["applied"] if c["applied"] else 0.0
+            parts.append(f"{rule}: {c['succeeded']}/{c['applied']} fixed ({round(100 * rate)}%)")
+        return "Local repairs: " + ("; ".join(parts) if parts else "none")
@@ -0,0 +1,190 @@
+import io
+import json
+import time
+import asyncio
+import itertools
+
+# batch states after which nothing else will happen
+FINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+
+def write_batch_file(requests, path):
+    """
+    Write (custom_id, body) pairs as a Batch API input file for the /v1/responses endpoint.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, body in requests:
+            f.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/responses",
+                "body": body,
+            }) + "\n")
+    return path
+
+
+async def submit_batch(client, path):
+    with open(path, "rb") as f:
+        input_file = await client.files.create(file=f, purpose="batch")
+    return await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/responses",
+        completion_window="24h",
+    )
+
+
+async def wait_for_batch(client, batch_id, poll_every=30.0):
+    start = time.time()
+    while True:
+        batch = await client.batches.retrieve(batch_id)
+        counts = getattr(batch, "request_counts", None)
+        done = f"{counts.completed}/{counts.total}" if counts else "?"
+        print(f"Batch {batch_id}: {batch.status} ({done} done, {round(time.time() - start)} s)")
+        if batch.status in FINAL_STATES:
+            return batch
+        await asyncio.sleep(poll_every)
+
+
+def output_text(body):
+    """
+    The first assistant text of a /v1/responses body, or None if the response did not complete
+    or has no message text to use.
+    """
+    if not isinstance(body, dict) or body.get("status") != "completed":
+        return None
+    for block in body.get("output") or ():
+        if block.get("type") != "message":
+            continue
+        for content in block.get("content") or ():
+            if content.get("type") == "output_text" and content.get("text"):
+                return content["text"].strip()
+    return None
+
+
+async def read_batch_results(client, batch):
+    """
+    Return {custom_id: response body} for every request that completed with output text, and
+    {custom_id: error text} for every request that did not.
+    """
+    results, errors = {}, {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = await client.files.content(file_id)
+        for line in content.text.splitlines():
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            response = row.get("response") or {}
+            body = response.get("body")
+            if row.get("error") or response.get("status_code") != 200:
+                errors[row["custom_id"]] = json.dumps(row.get("error") or body)
+            elif output_text(body) is None:
+                # e.g. status "incomplete" after hitting max_output_tokens, or only reasoning output
+                status = body.get("status") if isinstance(body, dict) else None
+                errors[row["custom_id"]] = f"response {status or 'without a status'} and no output text"
+            else:
+                results[row["custom_id"]] = body
+    return results, errors
+
+
+async def run_batch(client, requests, path, poll_every=30.0):
+    """
+    Write, submit and wait for one batch; returns (results, errors) keyed by custom_id.
+    """
+    if not requests:
+        return {}, {}
+    write_batch_file(requests, path)
+    batch = await submit_batch(client, path)
+    print(f"Submitted batch {batch.id} with {len(requests)} requests from {path}.")
+    batch = await wait_for_batch(client, batch.id, poll_every)
+    results, errors = await read_batch_results(client, batch)
+    # anything the batch never reported on (expired, cancelled) counts as failed
+    for custom_id, _ in requests:
+        if custom_id not in results and custom_id not in errors:
+            errors[custom_id] = f"batch {batch.status} before this request ran"
+    return results, errors
+
+
+class _Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class LocalBatchServer:
+    """
+    In-process stand-in for the files/batches part of the OpenAI client, for tests and dry runs.
+    `responder(body, custom_id)` returns the output text for one /v1/responses request body
+    (or a whole response body, e.g. one with status "incomplete"), or raises to make that request
+    fail. Batches complete `delay` seconds after they are created; with `expire_after`, a batch
+    only runs that many requests and then expires with the rest unreported.
+    """
+
+    def __init__(self, responder, delay=0.0, expire_after=None):
+        self.responder = responder
+        self.delay = delay
+        self.expire_after = expire_after
+        self._files = {}
+        self._batches = {}
+        self._ids = itertools.count()
+        self.files = _Obj(create=self._create_file, content=self._file_content)
+        self.batches = _Obj(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    def _new_id(self, prefix):
+        return f"{prefix}_local_{next(self._ids)}"
+
+    async def _create_file(self, file, purpose):
+        data = file.read()
+        file_id = self._new_id("file")
+        self._files[file_id] = data.decode("utf-8") if isinstance(data, bytes) else data
+        return _Obj(id=file_id, purpose=purpose)
+
+    async def _file_content(self, file_id):
+        return _Obj(text=self._files[file_id])
+
+    async def _create_batch(self, input_file_id, endpoint, completion_window):
+        batch_id = self._new_id("batch")
+        self._batches[batch_id] = {"input_file_id": input_file_id, "created": time.time(), "batch": None}
+        return await self._retrieve_batch(batch_id)
+
+    def _process(self, batch_id, input_file_id):
+        out, err = io.StringIO(), io.StringIO()
+        total = completed = 0
+        status = "completed"
+        for line in self._files[input_file_id].splitlines():
+            if not line.strip():
+                continue
+            if self.expire_after is not None and total >= self.expire_after:
+                status = "expired"
+                break
+            total += 1
+            request = json.loads(line)
+            try:
+                text = self.responder(request["body"], request["custom_id"])
+            except Exception as e:
+                err.write(json.dumps({"custom_id": request["custom_id"], "response": None,
+                                      "error": {"message": repr(e)}}) + "\n")
+                continue
+            completed += 1
+            body = text if isinstance(text, dict) else {
+                "status": "completed",
+                "output": [{"type": "message", "content": [{"type": "output_text", "text": text}]}]}
+            out.write(json.dumps({"custom_id": request["custom_id"],
+                                  "response": {"status_code": 200, "body": body}, "error": None}) + "\n")
+
+        output_file_id = self._new_id("file")
+        error_file_id = self._new_id("file")
+        self._files[output_file_id] = out.getvalue()
+        self._files[error_file_id] = err.getvalue()
+        return _Obj(id=batch_id, status=status, output_file_id=output_file_id,
+                    error_file_id=error_file_id,
+                    request_counts=_Obj(total=total, completed=completed, failed=total - completed))
+
+    async def _retrieve_batch(self, batch_id):
+        entry = self._batches[batch_id]
+        if entry["batch"] is None and time.time() - entry["created"] >= self.delay:
+            entry["batch"] = self._process(batch_id, entry["input_file_id"])
+        if entry["batch"] is not None:
+            return entry["batch"]
+        return _Obj(id=batch_id, status="in_progress", output_file_id=None, error_file_id=None,
+                    request_counts=_Obj(total=0, completed=0, failed=0))
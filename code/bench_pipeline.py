@@ -0,0 +1,286 @@
+import os
+import re
+import sys
+import glob
+import json
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import importlib.util
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# chart_image1 is the Spain deficit data, chart_image2 the cellphone prices
+DATASETS = {"spain": "chart_image1", "cellphone": "chart_image2"}
+
+# where the synthetic failure goes: right after the last import, so it fails before any drawing
+SYNTHETIC_FAILURE = 'raise RuntimeError("synthetic failure injected by bench_pipeline")\n'
+
+
+def parse_latency(spec):
+    """
+    Turn "const:2", "uniform:1,4", "normal:3,0.5" or "lognormal:1.0,0.4" into a sampler of seconds.
+    """
+    kind, _, args = spec.partition(":")
+    params = [float(a) for a in args.split(",") if a]
+    samplers = {
+        "const": lambda rng: params[0],
+        "uniform": lambda rng: rng.uniform(params[0], params[1]),
+        "normal": lambda rng: max(0.0, rng.gauss(params[0], params[1])),
+        "lognormal": lambda rng: rng.lognormvariate(params[0], params[1]),
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown latency distribution {kind!r}, expected one of {list(samplers)}")
+    return samplers[kind]
+
+
+def load_recordings(root, limit=None):
+    """
+    {img_name: {"plan": text, "code": text}} for every generated/ folder with a plan and a script.
+    """
+    recordings = {}
+    for plan_fname in sorted(glob.glob(os.path.join(root, "generated", "*", "*_design_plan.txt"))):
+        folder = os.path.dirname(plan_fname)
+        img_name = os.path.basename(folder)
+        code_fname = os.path.join(folder, f"{img_name}_chart_code.py")
+        if not os.path.exists(code_fname):
+            continue
+        with open(plan_fname, "r", encoding="utf-8") as f:
+            plan = f.read()
+        with open(code_fname, "r", encoding="utf-8") as f:
+            code = f.read()
+        recordings[img_name] = {"plan": plan, "code": code}
+        if limit and len(recordings) >= limit:
+            break
+    return recordings
+
+
+def inject_failure(code):
+    lines = code.splitlines(keepends=True)
+    last_import = max((i for i, line in enumerate(lines)
+                       if re.match(r"(import|from)\s", line)), default=-1)
+    lines.insert(last_import + 1, SYNTHETIC_FAILURE)
+    return "".join(lines)
+
+
+class _Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class _ReplayStream:
+    def __init__(self, text, delay, prompt="", cached=0, chunk=400):
+        self.chunks = [text[i:i + chunk] for i in range(0, len(text), chunk)]
+        self.delay = delay
+        self.text = text
+        self.prompt = prompt
+        self.cached = cached
+        self.sent = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.sent == 0:
+            # the whole latency goes before the first token, like a reasoning model
+            await asyncio.sleep(self.delay)
+        if self.sent < len(self.chunks):
+            self.sent += 1
+            return _Obj(type="response.output_text.delta", delta=self.chunks[self.sent - 1])
+        if self.sent == len(self.chunks):
+            self.sent += 1
+            return _Obj(type="response.completed", response=_Obj(usage=_usage(self.text, self.prompt, self.cached)))
+        raise StopAsyncIteration
+
+    async def close(self):
+        pass
+
+
+def _usage(text, prompt="", cached=0):
+    return _Obj(input_tokens=len(prompt) // 4, output_tokens=len(text) // 4,
+                total_tokens=(len(prompt) + len(text)) // 4,
+                input_tokens_details=_Obj(cached_tokens=cached))
+
+
+def _cached_tokens(prompt, seen):
+    """
+    Tokens of `prompt` a provider prompt cache would serve: the longest prefix shared with an
+    earlier request, counted from 1024 tokens up in steps of 128.
+    """
+    shared = max((len(os.path.commonprefix([prompt, earlier])) for earlier in seen), default=0) // 4
+    return shared // 128 * 128 if shared >= 1024 else 0
+
+
+class ReplayClient:
+    """
+    Stands in for AsyncOpenAI: answers design-plan, chart-code and recode requests with the
+    recorded generated/ artifacts of the pipeline being run, after a sampled latency.
+    With `fail_rate` a first-draft script is broken on purpose so the recode path gets exercised.
+    """
+
+    def __init__(self, gc, recordings, plan_latency, code_latency, fail_rate=0.0, seed=0):
+        self.gc = gc
+        self.recordings = recordings
+        self.plan_latency = plan_latency
+        self.code_latency = code_latency
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.requests = {"plan": 0, "code": 0, "recode": 0}
+        self.prompts = set()
+        self.batch_items = {}
+        self.responses = _Obj(create=self._create)
+        self.files = _Obj(create=self._upload)
+
+    async def _upload(self, file, purpose):
+        return _Obj(id="file_replay")
+
+    def _answer(self, system_prompt, img_name=None):
+        # hedged candidates run under "<img_name>#<i>"
+        img_name = img_name or self.gc.CACHE_VARIANT.get().split("#")[0]
+        recording = self.recordings[img_name]
+        if system_prompt in (self.gc.DESIGN_PROMPT, self.gc.DESIGN_SPEC_PROMPT):
+            self.requests["plan"] += 1
+            return recording["plan"], self.plan_latency(self.rng)
+        if system_prompt == self.gc.RECODE_PROMPT:
+            self.requests["recode"] += 1
+            return f"```python\n{recording['code']}\n```", self.code_latency(self.rng)
+        self.requests["code"] += 1
+        code = recording["code"]
+        if self.rng.random() < self.fail_rate:
+            code = inject_failure(code)
+        return f"```python\n{code}\n```", self.code_latency(self.rng)
+
+    async def _create(self, model, input, reasoning=None, prompt_cache_key=None, stream=False):
+        system_prompt = input[0]["content"][0]["text"]
+        text, delay = self._answer(system_prompt)
+        prompt = system_prompt + input[1]["content"][0]["text"]
+        cached = _cached_tokens(prompt, self.prompts)
+        self.prompts.add(prompt)
+        if stream:
+            return _ReplayStream(text, delay, prompt, cached)
+        await asyncio.sleep(delay)
+        return _Obj(output_text=text, usage=_usage(text, prompt, cached))
+
+    def batch_responder(self, body, custom_id):
+        """
+        Answer one request of a LocalBatchServer batch. The first request of every batch fails and
+        the second comes back incomplete, so the online fallback for failed batch items gets exercised.
+        """
+        img_name, stage = custom_id.rsplit(":", 1)
+        self.batch_items[stage] = self.batch_items.get(stage, 0) + 1
+        if self.batch_items[stage] == 1:
+            raise RuntimeError("simulated failed batch item")
+        if self.batch_items[stage] == 2:
+            return {"status": "incomplete", "incomplete_details": {"reason": "max_output_tokens"},
+                    "output": [{"type": "reasoning", "summary": []}]}
+        text, _ = self._answer(body["input"][0]["content"][0]["text"], img_name)
+        return text
+
+    async def close(self):
+        pass
+
+
+def load_pipeline_module():
+    spec = importlib.util.spec_from_file_location("generate_chart", os.path.join(REPO, "code", "generate-chart.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentiles(values, qs=(50, 95)):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return {f"p{q}": None for q in qs}
+    return {f"p{q}": round(values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))], 3)
+            for q in qs}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay recorded generated/ plans and code through the pipeline with synthetic latency.")
+    parser.add_argument("--mode", default="staged", choices=["staged", "pipelines", "batch"],
+                        help="batch sends plans and first drafts through a LocalBatchServer that fails one "
+                             "item, returns one incomplete and expires before the last plan")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--render-workers", type=int, default=2)
+    parser.add_argument("--plan-latency", default="lognormal:2.3,0.3", help="seconds per design-plan request")
+    parser.add_argument("--code-latency", default="lognormal:2.8,0.3", help="seconds per code or recode request")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of first drafts broken on purpose")
+    parser.add_argument("--limit", type=int, default=None, help="only replay the first N recorded pipelines")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--unlimited", action="store_true", help="lift the client-side rate limits")
+    parser.add_argument("--hedge", type=int, default=1, help="HEDGE_K for the run")
+    parser.add_argument("--json", help="also write the report here, for comparing runs")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args(argv)
+
+    # everything the pipeline writes goes to a scratch directory; nothing is cached or stamped.
+    # recodes replay the same script, so a layout check would only burn attempts
+    scratch = tempfile.mkdtemp(prefix="bench_pipeline_")
+    os.environ.update({"LLM_CACHE_MODE": "bypass", "INCREMENTAL": "0", "TRACE_DIR": "", "LAYOUT_CHECK": "0",
+                       "MANIFEST_DB": os.path.join(scratch, "manifest.sqlite"), "BATCH_POLL_SECONDS": "0.05"})
+    os.chdir(REPO)
+    sys.path.insert(0, os.path.join(REPO, "code"))
+    gc = load_pipeline_module()
+    gc.RENDER_WORKERS = args.render_workers
+    gc.HEDGE_K = args.hedge
+    if args.unlimited:
+        from rate_limit import RateLimiter
+        gc.LIMITER = RateLimiter(rpm=1e6, tpm=1e9, max_concurrency=1000, start_concurrency=1000)
+
+    recordings = load_recordings(REPO, args.limit)
+    jobs = []
+    for img_name in recordings:
+        dataset, factor, _ = gc.parse_img_name(img_name)
+        jobs.append((getattr(gc, DATASETS.get(dataset, "chart_image1")), factor or 1, img_name))
+    client = ReplayClient(gc, recordings, parse_latency(args.plan_latency),
+                          parse_latency(args.code_latency), args.fail_rate, args.seed)
+    batch_client = None
+    if args.mode == "batch":
+        from batch_mode import LocalBatchServer
+        batch_client = LocalBatchServer(client.batch_responder, delay=0.1, expire_after=max(len(jobs) - 1, 1))
+
+    os.chdir(scratch)
+    try:
+        start = gc.time.time()
+        results = asyncio.run(gc.run_sweep(jobs, concurrency=args.concurrency, mode=args.mode,
+                                           batch_client=batch_client, llm_client=client))
+        wall = gc.time.time() - start
+        _, rows = gc.MANIFEST.query(
+            "SELECT plan_s, codegen_s, check_s, render_s, recode_s, total_s, ttfr_s FROM runs")
+    finally:
+        os.chdir(REPO)
+        if not args.keep:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    columns = ["plan", "codegen", "check", "render", "recode", "total", "ttfr"]
+    report = {
+        "args": vars(args),
+        "pipelines": len(results),
+        "succeeded": sum(1 for r in results if r["success"]),
+        "wall_s": round(wall, 2),
+        "throughput_per_min": round(len(results) / wall * 60, 2) if wall > 0 else None,
+        "recode_rate": round(sum(1 for r in results if r["attempts"] > 1) / len(results), 3) if results else None,
+        "requests": client.requests,
+        "stages": {name: percentiles([row[i] for row in rows]) for i, name in enumerate(columns)},
+    }
+
+    print("=========================")
+    print(f"Replayed {report['pipelines']} pipelines ({report['succeeded']} succeeded) in {report['wall_s']} s: "
+          f"{report['throughput_per_min']} pipelines/minute, recode rate {report['recode_rate']}.")
+    print(f"Requests: {client.requests}")
+    print(f"{'stage':<10}{'p50 s':>9}{'p95 s':>9}")
+    for name, p in report["stages"].items():
+        print(f"{name:<10}{p['p50'] if p['p50'] is not None else '-':>9}{p['p95'] if p['p95'] is not None else '-':>9}")
+    if args.keep:
+        print(f"Scratch output kept in {scratch}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import statistics
+import tempfile
+
+from render_pool import RenderPool
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# a script regresses when its median render time grows by this factor and by at least MIN_SLOWDOWN_S
+TIME_THRESHOLD = 1.25
+MIN_SLOWDOWN_S = 0.05
+RSS_THRESHOLD = 1.2
+# output size changes beyond this fraction are reported (fonts and backends show up here first)
+SIZE_THRESHOLD = 0.1
+
+
+def environment():
+    """
+    The things that move render performance: library versions, installed fonts, our worker code.
+    """
+    import numpy
+    import matplotlib
+    from matplotlib import font_manager
+
+    fonts = sorted(f.fname for f in font_manager.fontManager.ttflist)
+    with open(os.path.join(REPO, "code", "render_pool.py"), "rb") as f:
+        worker_code = f.read()
+    return {
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+        "matplotlib": matplotlib.__version__,
+        "numpy": numpy.__version__,
+        "fonts": hashlib.sha256("\n".join(fonts).encode("utf-8")).hexdigest()[:16],
+        "render_pool": hashlib.sha256(worker_code).hexdigest()[:16],
+    }
+
+
+def find_scripts(pattern="*"):
+    return sorted(glob.glob(os.path.join(REPO, "generated", pattern, "*_chart_code.py")))
+
+
+def bench_script(script, repeat, scratch):
+    """
+    Render one script `repeat` times on a fresh render worker, so its peak RSS is its own.
+    """
+    name = os.path.basename(os.path.dirname(script))
+    out_dir = os.path.join(scratch, "generated", name)
+    os.makedirs(out_dir, exist_ok=True)
+
+    pool = RenderPool(size=1)
+    times = []
+    result = None
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = pool.run(script)
+            times.append(time.perf_counter() - start)
+            if result.returncode != 0:
+                break
+    finally:
+        pool.close()
+
+    # whatever the script saved, wherever it saved it (not the *_text.json sidecars)
+    size = sum(os.path.getsize(f) for f in set(getattr(result, "saved", [])) if os.path.isfile(f))
+    shutil.rmtree(out_dir, ignore_errors=True)
+    return {
+        "ok": result.returncode == 0,
+        "error": (result.stderr.strip().splitlines() or [""])[-1] if result.returncode else None,
+        "median_s": round(statistics.median(times), 4),
+        "min_s": round(min(times), 4),
+        "runs": len(times),
+        "peak_rss_kb": getattr(result, "peak_rss_kb", None),
+        "output_bytes": size,
+    }
+
+
+def compare(results, baseline):
+    """
+    Return a list of human-readable regressions of `results` against `baseline`.
+    """
+    problems = []
+    old = baseline["scripts"]
+    for name, new in results.items():
+        if name not in old:
+            continue
+        prev = old[name]
+        if prev["ok"] and not new["ok"]:
+            problems.append(f"{name}: now fails ({new['error']})")
+            continue
+        if not new["ok"]:
+            continue
+        if (new["median_s"] > prev["median_s"] * TIME_THRESHOLD
+                and new["median_s"] - prev["median_s"] > MIN_SLOWDOWN_S):
+            problems.append(f"{name}: median {prev['median_s']} s -> {new['median_s']} s")
+        if prev.get("peak_rss_kb") and new.get("peak_rss_kb") and new["peak_rss_kb"] > prev["peak_rss_kb"] * RSS_THRESHOLD:
+            problems.append(f"{name}: peak RSS {prev['peak_rss_kb'] // 1024} MiB -> {new['peak_rss_kb'] // 1024} MiB")
+        if prev["output_bytes"] and abs(new["output_bytes"] - prev["output_bytes"]) > prev["output_bytes"] * SIZE_THRESHOLD:
+            problems.append(f"{name}: output {prev['output_bytes']} B -> {new['output_bytes']} B")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Render every generated/*/ chart script N times and compare against a stored baseline.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--filter", default="*", help="glob over generated/ folder names")
+    parser.add_argument("--baseline", default=os.path.join(REPO, ".bench", "render_baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    args = parser.parse_args(argv)
+
+    scripts = find_scripts(args.filter)
+    env = environment()
+    scratch = tempfile.mkdtemp(prefix="bench_render_")
+    # the scripts write to generated/<name>/ relative to the working directory
+    cwd = os.getcwd()
+    os.chdir(scratch)
+    results = {}
+    try:
+        for i, script in enumerate(scripts, start=1):
+            name = os.path.basename(os.path.dirname(script))
+            results[name] = r = bench_script(script, args.repeat, scratch)
+            rss = f"{r['peak_rss_kb'] // 1024} MiB" if r["peak_rss_kb"] else "-"
+            status = "ok" if r["ok"] else f"FAILED: {r['error']}"
+            print(f"[{i}/{len(scripts)}] {name:<28} {r['median_s']:>7.3f} s  {rss:>8}  "
+                  f"{r['output_bytes'] / 1024:>7.0f} KiB  {status}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    ok = [r for r in results.values() if r["ok"]]
+    print("-------------------------")
+    print(f"{len(ok)}/{len(results)} scripts rendered; total median time "
+          f"{round(sum(r['median_s'] for r in ok), 2)} s.")
+    run = {"environment": env, "repeat": args.repeat, "created": time.time(), "scripts": results}
+
+    regressions = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        changed = [f"{k} {baseline['environment'].get(k)} -> {v}"
+                   for k, v in env.items() if baseline["environment"].get(k) != v]
+        print("Environment changes since the baseline: " + ("; ".join(changed) if changed else "none"))
+        regressions = compare(results, baseline)
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        for line in regressions:
+            print("  " + line)
+    else:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
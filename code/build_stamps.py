@@ -0,0 +1,81 @@
+import os
+import json
+import hashlib
+from collections import Counter
+
+
+def input_hash(*parts) -> str:
+    """
+    Hash everything an artifact was built from (prompt text, loadings, data, model, upstream hashes).
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        data = (part if isinstance(part, str) else json.dumps(part, sort_keys=True)).encode("utf-8")
+        # length-prefix each part so ("ab", "c") and ("a", "bc") hash differently
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+
+def file_hash(path):
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class BuildStamps:
+    """
+    Make-style up-to-date checks for the files under generated/.
+    Every artifact gets a stamp (the hash of its inputs and the hash of the file it produced)
+    in a stamps file next to it. An artifact is up to date when its inputs hash the same and
+    the file on disk is still the one that was stamped.
+    """
+
+    def __init__(self, fname="build_stamps.json", enabled=True):
+        self.fname = fname
+        self.enabled = enabled
+        self.skipped = Counter()
+        self.rebuilt = Counter()
+
+    def _path(self, artifact):
+        return os.path.join(os.path.dirname(artifact), self.fname)
+
+    def _load(self, artifact):
+        try:
+            with open(self._path(artifact), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def fresh(self, artifact, inputs, stage=None) -> bool:
+        """
+        True when `artifact` was built from `inputs` and has not changed since.
+        With a `stage` name the skip or rebuild is counted for the summary.
+        """
+        stamp = self._load(artifact).get(os.path.basename(artifact))
+        up_to_date = (self.enabled and stamp is not None and stamp["inputs"] == inputs
+                      and stamp["output"] == file_hash(artifact))
+        if stage is not None:
+            (self.skipped if up_to_date else self.rebuilt)[stage] += 1
+        return up_to_date
+
+    def record(self, artifact, inputs):
+        stamps = self._load(artifact)
+        stamps[os.path.basename(artifact)] = {"inputs": inputs, "output": file_hash(artifact)}
+        path = self._path(artifact)
+        # write then rename so a crash mid-write never leaves a torn stamps file
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(stamps, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+
+    def summary(self) -> str:
+        stages = sorted(set(self.skipped) | set(self.rebuilt))
+        if not stages:
+            return "Incremental build: nothing checked"
+        return "Incremental build: " + "; ".join(
+            f"{s} {self.skipped[s]} up to date, {self.rebuilt[s]} rebuilt" for s in stages)
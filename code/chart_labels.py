@@ -0,0 +1,166 @@
+import sys
+import time
+
+from layout_check import SpatialGrid
+
+# directions tried around each anchor, in order of preference (up-right first)
+DIRECTIONS = ((1, 1), (-1, 1), (1, -1), (-1, -1), (0, 1), (0, -1), (1, 0), (-1, 0))
+# distances from the anchor in points; labels pushed past the first ring get a leader line
+RINGS = (5, 12, 22, 36, 54)
+# room kept free around every label, in points
+PADDING = 2.0
+# half-size of the keep-out box around every anchor point, in points
+ANCHOR_SIZE = 3.0
+LEADER = {"arrowstyle": "-", "color": "0.45", "linewidth": 0.6, "shrinkA": 0, "shrinkB": 2}
+
+# (text, font) -> (width, height) in points; the same labels come back on every call and every chart
+_METRICS = {}
+
+
+def _renderer(fig):
+    canvas = fig.canvas
+    if not hasattr(canvas, "get_renderer"):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        canvas = FigureCanvasAgg(fig)
+    return canvas.get_renderer()
+
+
+def text_size(text, fontprops, renderer):
+    """
+    (width, height) of a possibly multi-line string in points, measured once per string and font.
+    Only the text is measured; nothing is drawn.
+    """
+    key = (text, hash(fontprops))
+    if key not in _METRICS:
+        to_points = 72.0 / renderer.dpi
+        lines = text.split("\n")
+        widths, heights = [], []
+        for line in lines:
+            ismath = line.count("$") >= 2
+            w, h, _ = renderer.get_text_width_height_descent(line or " ", fontprops, ismath=ismath)
+            widths.append(w)
+            heights.append(h)
+        # matplotlib spaces lines 1.2 times the height of "lp" apart
+        _, line_height, _ = renderer.get_text_width_height_descent("lp", fontprops, ismath=False)
+        height = heights[-1] + 1.2 * line_height * (len(lines) - 1)
+        _METRICS[key] = (max(widths) * to_points, height * to_points)
+    return _METRICS[key]
+
+
+def _box(anchor, size, direction, distance):
+    """
+    Label box (x0, y0, x1, y1) in points for a label `distance` points from `anchor` along `direction`.
+    """
+    (x, y), (w, h), (dx, dy) = anchor, size, direction
+    ox, oy = x + dx * distance, y + dy * distance
+    x0 = ox if dx > 0 else ox - w if dx < 0 else ox - w / 2
+    y0 = oy if dy > 0 else oy - h if dy < 0 else oy - h / 2
+    return (x0 - PADDING, y0 - PADDING, x0 + w + PADDING, y0 + h + PADDING)
+
+
+def _overlap(a, b):
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    return width * height if width > 0 and height > 0 else 0.0
+
+
+def _outside(box, frame):
+    inside = _overlap(box, frame)
+    return (box[2] - box[0]) * (box[3] - box[1]) - inside
+
+
+def place_labels(ax, labels, fontsize=None, avoid=(), leader=True, rings=RINGS, **text_kwargs):
+    """
+    Annotate `labels`, a list of (x, y, text) in data coordinates. Each label takes the first spot
+    around its point, ring by ring, that overlaps no other label, no other labelled point and
+    nothing in `avoid` (texts or other artists already placed), and stays inside the axes;
+    if there is none, the spot with the least overlap. Labels earlier in the list get the better spots.
+    Call it after the axis limits and the figure size are set. Extra keyword arguments go to
+    ax.annotate (color, fontweight, bbox, ...). Returns the Annotation artists in label order.
+    """
+    from matplotlib.text import Text
+
+    fig = ax.figure
+    renderer = _renderer(fig)
+    to_points = 72.0 / fig.dpi
+    fontprops = Text(fontsize=fontsize, **{k: v for k, v in text_kwargs.items() if k not in ("bbox", "arrowprops")}
+                     ).get_fontproperties()
+    # a text bbox adds its pad (0.3 of the font size by default) on every side
+    box_pad = 0.6 * fontprops.get_size_in_points() if text_kwargs.get("bbox") else 0.0
+
+    anchors = [tuple(p * to_points for p in ax.transData.transform((x, y))) for x, y, _ in labels]
+    sizes = []
+    for _, _, text in labels:
+        w, h = text_size(str(text), fontprops, renderer)
+        sizes.append((w + box_pad, h + box_pad))
+    frame = tuple(v * to_points for v in ax.bbox.extents)
+
+    typical = sorted(max(s) for s in sizes)[len(sizes) // 2] if sizes else 10.0
+    grid = SpatialGrid(typical + 2 * PADDING)
+    boxes = {}
+    for i, (x, y) in enumerate(anchors):
+        boxes["anchor", i] = (x - ANCHOR_SIZE, y - ANCHOR_SIZE, x + ANCHOR_SIZE, y + ANCHOR_SIZE)
+        grid.insert(("anchor", i), boxes["anchor", i])
+    for j, artist in enumerate(avoid):
+        ext = artist.get_window_extent(renderer)
+        boxes["avoid", j] = tuple(v * to_points for v in ext.extents)
+        grid.insert(("avoid", j), boxes["avoid", j])
+
+    artists = []
+    for i, (x, y, text) in enumerate(labels):
+        best = None
+        for distance in rings:
+            for direction in DIRECTIONS:
+                box = _box(anchors[i], sizes[i], direction, distance)
+                # running off the axes is worse than sitting on another label
+                cost = 4 * _outside(box, frame)
+                for key in grid.query(box):
+                    if best is not None and cost >= best[0]:
+                        break
+                    if key != ("anchor", i):
+                        cost += _overlap(box, boxes[key])
+                if best is None or cost < best[0]:
+                    best = (cost, box, direction, distance)
+                if cost == 0:
+                    break
+            if best[0] == 0:
+                break
+
+        _, box, (dx, dy), distance = best
+        boxes["label", i] = box
+        grid.insert(("label", i), box)
+        kwargs = dict(text_kwargs)
+        if leader and distance > rings[0]:
+            kwargs.setdefault("arrowprops", LEADER)
+        artists.append(ax.annotate(
+            text, xy=(x, y), xycoords="data", xytext=(dx * distance, dy * distance), textcoords="offset points",
+            ha="left" if dx > 0 else "right" if dx < 0 else "center",
+            va="bottom" if dy > 0 else "top" if dy < 0 else "center",
+            fontsize=fontsize, **kwargs))
+    return artists
+
+
+if __name__ == "__main__":
+    # python code/chart_labels.py [n [out.png]]   (times the placement of n labels on a scatter plot)
+    import numpy as np
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    rng = np.random.default_rng(0)
+    x, y = rng.normal(size=n), rng.normal(size=n)
+    fig, ax = plt.subplots(figsize=(10, 7))
+    ax.scatter(x, y, s=12)
+    ax.set_xlim(x.min() - 0.5, x.max() + 0.5)
+    ax.set_ylim(y.min() - 0.5, y.max() + 0.5)
+    labels = [(a, b, f"point {i}") for i, (a, b) in enumerate(zip(x, y))]
+    for attempt in ("cold", "warm"):
+        for artist in ax.texts[:]:
+            artist.remove()
+        start = time.perf_counter()
+        place_labels(ax, labels, fontsize=8)
+        print(f"{attempt}: placed {n} labels in {(time.perf_counter() - start) * 1000:.1f} ms")
+    if len(sys.argv) > 2:
+        fig.savefig(sys.argv[2], dpi=100)
+        print(f"Wrote {sys.argv[2]}")
@@ -0,0 +1,153 @@
+import io
+import ast
+import re
+import json
+import builtins
+import tokenize
+
+# names that exist at runtime in any script without being bound in the source
+IMPLICIT_NAMES = set(dir(builtins)) | {"__file__", "__name__", "__builtins__", "__doc__"}
+
+
+def load_deny_list(path="prompts/deny-list.json"):
+    """
+    Each entry is {"pattern": <regex>, "message": <why it is banned>}.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    return [(re.compile(e["pattern"]), e["message"]) for e in entries]
+
+
+class _Bindings(ast.NodeVisitor):
+    """
+    Collect every name bound anywhere in the module, and every name that is read.
+    Scopes are flattened on purpose: this is a cheap pre-render gate, so it only
+    reports names that are never bound at all, which are guaranteed NameErrors.
+    """
+
+    def __init__(self):
+        self.bound = set()
+        self.loads = []
+        self.star_import = False
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.loads.append(node)
+        else:
+            self.bound.add(node.id)
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.bound.add((alias.asname or alias.name).split(".")[0])
+
+    def visit_ImportFrom(self, node):
+        for alias in node.names:
+            if alias.name == "*":
+                self.star_import = True
+            else:
+                self.bound.add(alias.asname or alias.name)
+
+    def _visit_def(self, node):
+        self.bound.add(node.name)
+        self.generic_visit(node)
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_ClassDef = _visit_def
+
+    def visit_arg(self, node):
+        self.bound.add(node.arg)
+        self.generic_visit(node)
+
+    def visit_ExceptHandler(self, node):
+        if node.name:
+            self.bound.add(node.name)
+        self.generic_visit(node)
+
+    def visit_Global(self, node):
+        self.bound.update(node.names)
+
+    visit_Nonlocal = visit_Global
+
+    def visit_MatchAs(self, node):
+        if node.name:
+            self.bound.add(node.name)
+        self.generic_visit(node)
+
+    def visit_MatchStar(self, node):
+        if node.name:
+            self.bound.add(node.name)
+
+    def visit_MatchMapping(self, node):
+        if node.rest:
+            self.bound.add(node.rest)
+        self.generic_visit(node)
+
+
+def _strip_comments(source):
+    """
+    Return the source lines with comments removed, so the deny-list only matches real code.
+    """
+    lines = source.splitlines()
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(source).readline):
+            if tok.type == tokenize.COMMENT:
+                row, col = tok.start
+                lines[row - 1] = lines[row - 1][:col]
+    except (tokenize.TokenError, IndentationError):
+        pass
+    return lines
+
+
+def find_banned(source, deny_list):
+    """
+    Return (line number, message) for the first match of each deny-list entry, ignoring comments.
+    Also works on an incomplete prefix of a script, e.g. while a response is still streaming.
+    """
+    found = []
+    code_lines = _strip_comments(source)
+    for pattern, message in deny_list:
+        for lineno, line in enumerate(code_lines, start=1):
+            if pattern.search(line):
+                found.append((lineno, message))
+                break
+    return found
+
+
+def check_code(source, filename="<chart>", deny_list=()):
+    """
+    Statically check generated chart code before it is executed.
+    Returns None if the code passes, otherwise an error message written for the recoder.
+    """
+    lines = source.splitlines()
+
+    def where(lineno):
+        text = lines[lineno - 1].strip() if 0 < lineno <= len(lines) else ""
+        return f'File "{filename}", line {lineno}\n    {text}'
+
+    # 1. syntax
+    try:
+        tree = ast.parse(source, filename)
+        compile(tree, filename, "exec")
+    except SyntaxError as e:
+        return f"{where(e.lineno or 0)}\nSyntaxError: {e.msg}"
+
+    errors = []
+
+    # 2. names that are read but never bound
+    bindings = _Bindings()
+    bindings.visit(tree)
+    if not bindings.star_import:
+        reported = set()
+        for node in bindings.loads:
+            if node.id in bindings.bound or node.id in IMPLICIT_NAMES or node.id in reported:
+                continue
+            reported.add(node.id)
+            errors.append(
+                f"{where(node.lineno)}\nNameError: name '{node.id}' is not defined")
+
+    # 3. known bad constructs
+    for lineno, message in find_banned(source, deny_list):
+        errors.append(f"{where(lineno)}\nBannedConstruct: {message}")
+
+    if not errors:
+        return None
+    return "Static check failed before running the script:\n" + "\n".join(errors)
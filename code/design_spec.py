@@ -0,0 +1,222 @@
+import re
+import json
+import textwrap
+
+from text_sidecar import write_sidecar
+
+# chart types draw_spec can render without a code-generation call
+SUPPORTED_CHART_TYPES = ("paired_bar", "line")
+
+# presentation-sized defaults, scaled by the spec's font_scale
+TITLE_SIZE = 26
+SUBTITLE_SIZE = 18
+LABEL_SIZE = 16
+TICK_SIZE = 14
+ANNOTATION_SIZE = 15
+CAPTION_SIZE = 12
+
+DEFAULT_COLORS = ["#C62828", "#4A90A4", "#7B7B7B", "#E0A526"]
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "number": (int, float),
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def load_schema(path="prompts/design-spec.schema.json"):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _check(value, schema, path, errors):
+    """
+    Validate the subset of JSON Schema used by design-spec.schema.json.
+    """
+    types = schema.get("type")
+    if types is not None:
+        types = types if isinstance(types, list) else [types]
+        ok = any(
+            isinstance(value, _JSON_TYPES[t]) and not (t == "number" and isinstance(value, bool))
+            for t in types)
+        if not ok:
+            errors.append(f"{path}: expected {' or '.join(types)}, got {type(value).__name__}")
+            return
+
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} is not one of {schema['enum']}")
+    if "exclusiveMinimum" in schema and isinstance(value, (int, float)) and value <= schema["exclusiveMinimum"]:
+        errors.append(f"{path}: must be greater than {schema['exclusiveMinimum']}")
+
+    if isinstance(value, dict):
+        props = schema.get("properties", {})
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}: missing required field '{key}'")
+        for key, item in value.items():
+            if key in props:
+                _check(item, props[key], f"{path}.{key}", errors)
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}: unexpected field '{key}'")
+
+    if isinstance(value, list):
+        if len(value) < schema.get("minItems", 0):
+            errors.append(f"{path}: needs at least {schema['minItems']} items")
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            errors.append(f"{path}: allows at most {schema['maxItems']} items")
+        if "items" in schema:
+            for i, item in enumerate(value):
+                _check(item, schema["items"], f"{path}[{i}]", errors)
+
+
+def parse_spec(text, schema):
+    """
+    Pull the JSON design spec out of a model response and validate it.
+    Raises ValueError with every problem found.
+    """
+    text = re.sub(r"^```(?:json)?\n|```$", "", text.strip(), flags=re.MULTILINE).strip()
+    try:
+        spec = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Design spec is not valid JSON: {e}")
+
+    errors = []
+    _check(spec, schema, "spec", errors)
+
+    if not errors:
+        n = len(spec["data"]["x"])
+        for s in spec["data"]["series"]:
+            if len(s["values"]) != n:
+                errors.append(f"spec.data.series '{s['name']}': has {len(s['values'])} values for {n} x entries")
+    if errors:
+        raise ValueError("Design spec does not match the schema:\n" + "\n".join(errors))
+    return spec
+
+
+def renderer_supports(spec) -> bool:
+    return spec.get("chart_type") in SUPPORTED_CHART_TYPES
+
+
+def _anchor(spec, positions, x, series=None, y=None):
+    """
+    Resolve a data anchor (x plus a series name, or x plus y) to plot coordinates.
+    """
+    xs = spec["data"]["x"]
+    if x not in xs:
+        raise ValueError(f"Anchor x={x!r} is not in data.x")
+    i = xs.index(x)
+    if series is not None:
+        match = [s for s in spec["data"]["series"] if s["name"] == series]
+        if not match:
+            raise ValueError(f"Anchor series {series!r} is not in data.series")
+        k = spec["data"]["series"].index(match[0])
+        return positions[k][i], match[0]["values"][i] or 0.0
+    return positions[0][i] if spec["chart_type"] == "line" else float(i), y or 0.0
+
+
+def draw_spec(spec, image_fname, dpi=300):
+    """
+    Draw a paired-bar or line design spec straight to image_fname and return its text layout.
+    Uses the object-oriented Figure API (no pyplot state), so it is safe to call from worker threads.
+    """
+    from matplotlib.figure import Figure
+    import numpy as np
+
+    scale = spec.get("font_scale", 1.0)
+    ratio = spec["aspect_ratio"]
+    width = 9.0
+    height = width * ratio["height"] / ratio["width"]
+    fig = Figure(figsize=(width, height))
+
+    # stack the header lines top-down so long titles wrap instead of running into the subtitle
+    header = [(spec["title"], TITLE_SIZE * scale, {"fontweight": "bold"})]
+    if spec.get("subtitle"):
+        header.append((spec["subtitle"], SUBTITLE_SIZE * scale, {"color": "#444444"}))
+    y = 0.97
+    for text, size, style in header:
+        # roughly 0.55 em per character for the default sans-serif font
+        wrapped = textwrap.fill(text, width=max(10, int(width * 0.92 * 72 / (size * 0.55))))
+        fig.text(0.04, y, wrapped, fontsize=size, va="top", **style)
+        y -= (wrapped.count("\n") + 1) * size * 1.3 / (height * 72) + 0.01
+
+    caption_h = 0.0
+    if spec.get("caption"):
+        wrapped = textwrap.fill(spec["caption"], width=int(width * 0.92 * 72 / (CAPTION_SIZE * scale * 0.55)))
+        fig.text(0.04, 0.015, wrapped, fontsize=CAPTION_SIZE * scale, color="#666666", va="bottom")
+        caption_h = (wrapped.count("\n") + 1) * CAPTION_SIZE * scale * 1.3 / (height * 72)
+
+    bottom = 0.1 + caption_h
+    ax = fig.add_axes([0.12, bottom, 0.82, y - 0.03 - bottom])
+
+    xs = spec["data"]["x"]
+    series = spec["data"]["series"]
+    highlight = spec.get("highlight_color", "#E0A526")
+    idx = np.arange(len(xs), dtype=float)
+
+    # x position of every point, per series
+    if spec["chart_type"] == "paired_bar":
+        bar_w = 0.8 / len(series)
+        positions = [idx - 0.4 + bar_w * (k + 0.5) for k in range(len(series))]
+    else:
+        positions = [idx for _ in series]
+
+    for k, s in enumerate(series):
+        color = s.get("color", DEFAULT_COLORS[k % len(DEFAULT_COLORS)])
+        values = np.array([np.nan if v is None else v for v in s["values"]], dtype=float)
+        colors = [highlight if x in s.get("highlight", []) else color for x in xs]
+        hatches = ["////" if x in s.get("hatch", []) else None for x in xs]
+
+        if spec["chart_type"] == "paired_bar":
+            present = ~np.isnan(values)
+            bars = ax.bar(positions[k][present], values[present], width=bar_w,
+                          color=np.array(colors, dtype=object)[present], label=s["name"],
+                          edgecolor="white", linewidth=0.6, zorder=2)
+            for bar, hatch in zip(bars, np.array(hatches, dtype=object)[present]):
+                if hatch:
+                    bar.set_hatch(hatch)
+                    bar.set_alpha(0.6)
+        else:
+            ax.plot(positions[k], values, color=color, linewidth=2.5, label=s["name"], zorder=2)
+            ax.scatter(positions[k], values, c=colors, s=36, zorder=3)
+            dashed = [i for i, h in enumerate(hatches) if h]
+            if dashed:
+                ax.plot(positions[k][dashed], values[dashed], color=color, linewidth=2.5,
+                        linestyle="--", zorder=2)
+
+    ax.axhline(0, color="#333333", linewidth=0.8, zorder=1)
+    ax.set_xticks(idx)
+    ax.set_xticklabels([str(x) for x in xs], rotation=45 if len(xs) > 8 else 0,
+                       fontsize=TICK_SIZE * scale)
+    ax.tick_params(axis="y", labelsize=TICK_SIZE * scale)
+    for side in ("top", "right"):
+        ax.spines[side].set_visible(False)
+    if spec.get("x_label"):
+        ax.set_xlabel(spec["x_label"], fontsize=LABEL_SIZE * scale)
+    if spec.get("y_label"):
+        ax.set_ylabel(spec["y_label"], fontsize=LABEL_SIZE * scale)
+    if spec.get("legend", True):
+        ax.legend(frameon=False, fontsize=LABEL_SIZE * scale, loc="best")
+
+    for a in spec.get("annotations", []):
+        xy = _anchor(spec, positions, a["x"], a.get("series"), a.get("y"))
+        arrow = {"arrowstyle": "->", "color": highlight, "linewidth": 1.5} if a.get("arrow") else None
+        ax.annotate(a["text"], xy=xy, xytext=tuple(a.get("offset", (0, 24))),
+                    textcoords="offset points", ha="center", va="bottom",
+                    fontsize=ANNOTATION_SIZE * scale, arrowprops=arrow, zorder=4)
+
+    for shape in spec.get("shapes", []):
+        start = _anchor(spec, positions, shape["x"], shape.get("series"), shape.get("y"))
+        if shape["type"] == "circle":
+            ax.scatter([start[0]], [start[1]], s=900, facecolors="none",
+                       edgecolors=highlight, linewidths=2, zorder=5)
+        else:
+            end = _anchor(spec, positions, shape.get("to_x", shape["x"]),
+                          shape.get("to_series"), shape.get("to_y"))
+            ax.annotate("", xy=end, xytext=start, zorder=5,
+                        arrowprops={"arrowstyle": "->", "color": highlight, "linewidth": 2})
+
+    fig.savefig(image_fname, dpi=dpi, bbox_inches="tight")
+    return write_sidecar(fig, image_fname, dpi, "tight")
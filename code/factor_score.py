@@ -0,0 +1,166 @@
+import os
+import re
+import json
+import time
+import argparse
+import contextlib
+import sqlite3
+
+import numpy as np
+
+from manifest import Manifest, parse_img_name
+from loadings import Loadings, parse_target
+
+# what the text says, matched per text
+COMPARE = re.compile(r"\b(vs\.?|versus|than|compared|gap|difference|higher|lower|outperform\w*|behind|ahead)\b", re.I)
+SUMMARY = re.compile(r"\b(average|mean|median|total|overall|trend|peak|rose|fell|increas\w*|decreas\w*|"
+                     r"declin\w*|grew|growth|chang\w*)\b", re.I)
+METADATA = re.compile(r"\b(sources?|notes?|data|methodology)\s*:", re.I)
+NUMBER = re.compile(r"^\W*[-+−–]?\d[\d.,]*\s*(%|pp|pts?|bn|m|k)?\W*$", re.I)
+WORD = re.compile(r"[^\W_][\w'’.%-]*")
+# an annotation this long reads as a paragraph
+PARAGRAPH_WORDS = 20
+# text in these colors is plain, not highlighted
+NEUTRAL = re.compile(r"^#([0-9a-f]{2})\1\1$")
+
+
+def _words(text):
+    return len(WORD.findall(text))
+
+
+def features(info) -> dict:
+    """
+    The loadings variables that can be read off a rendered chart's text sidecar, by name.
+    Source, most Function variables, icons/logos/flags and decorative color are not observable
+    in the rendering and are left out (they count as missing, not as zero).
+    """
+    texts = [t for t in info["texts"] if t["role"] != "tick_label"]
+    elements = info.get("elements", {})
+    by_role = {}
+    for t in info["texts"]:
+        by_role.setdefault(t["role"], []).append(t)
+    words = {role: sum(_words(t["text"]) for t in items) for role, items in by_role.items()}
+    total = sum(words.values()) or 1
+    annotations = by_role.get("annotation", [])
+    mark_colors = set(elements.get("mark_colors", ()))
+    colored = [t for t in texts if t["role"] != "legend" and not NEUTRAL.match(t["color"])]
+
+    return {
+        "Title": float("title" in by_role),
+        "Subtitle": float("subtitle" in by_role),
+        "Annotation": float(len(annotations)),
+        "AxisAxes": float("axis_label" in by_role or "tick_label" in by_role),
+        "Legend": float("legend" in by_role),
+        "Caption": float("caption" in by_role),
+        "Paragraph": float(sum(_words(t["text"]) >= PARAGRAPH_WORDS for t in annotations)),
+        "Arrows": float(elements.get("arrows", 0) + sum(bool(t.get("arrow")) for t in texts)),
+        "Circles": float(elements.get("circles", 0)),
+        "Rectangles": float(elements.get("rectangles", 0) + sum(bool(t.get("boxed")) for t in texts)),
+        "Lines": float(elements.get("lines", 0)),
+        "Encoding": float(any(t["color"] in mark_colors for t in colored)),
+        "Highlight": float(sum(t["color"] not in mark_colors for t in colored)),
+        "CompareValues": float(sum(bool(COMPARE.search(t["text"])) for t in texts)),
+        "SummarizeValues": float(sum(bool(SUMMARY.search(t["text"])) for t in texts)),
+        "IdentifyValues": min(1.0, sum(bool(NUMBER.match(t["text"])) for t in annotations)
+                              / max(elements.get("marks", 0), 1)),
+        "PresentMetadata": float(any(METADATA.search(t["text"]) for t in texts)),
+        "WordCountTotal": float(total),
+        "WordCountAnnotation": words.get("annotation", 0) / total,
+        "WordCountSubtitle": words.get("subtitle", 0) / total,
+        "WordCountTitle": words.get("title", 0) / total,
+    }
+
+
+def feature_matrix(infos, names):
+    """
+    (charts x variables) matrix of features, NaN where a variable is not observable.
+    """
+    rows = [features(info) for info in infos]
+    return np.array([[row.get(n, np.nan) for n in names] for row in rows], dtype=float)
+
+
+def factor_scores(X, matrix):
+    """
+    Score every chart on every factor at once: standardize each observed variable across the
+    charts, then project onto the loadings of the observed variables, scaled so factors compare.
+    Scores are relative to the charts scored together.
+    """
+    observed = ~np.isnan(X).all(axis=0)
+    X, L = X[:, observed], matrix[observed]
+    std = X.std(axis=0)
+    Z = np.divide(X - X.mean(axis=0), std, out=np.zeros_like(X), where=std > 0)
+    return Z @ L / np.sqrt((L ** 2).sum(axis=0))
+
+
+def score_runs(manifest, loadings, where="success = 1"):
+    """
+    Score the latest run of every chart in the manifest that has a text sidecar against a
+    Loadings, and store factor_scores, factor_fit (score on the intended factor, or the weighted
+    score for a blend) and factor_rank (1 = the intended single factor scored highest).
+    Returns the number of charts scored.
+    """
+    _, rows = manifest.query(
+        f"SELECT MAX(id), img_name, factor, text_path FROM runs WHERE {where} AND text_path IS NOT NULL "
+        f"GROUP BY image_path")
+    ids, factors, infos = [], [], []
+    for run_id, img_name, factor, text_path in rows:
+        if not os.path.exists(text_path):
+            continue
+        with open(text_path, "r", encoding="utf-8") as f:
+            infos.append(json.load(f))
+        ids.append(run_id)
+        factors.append(factor or parse_img_name(img_name)[1])
+    if len(infos) < 2:
+        # standardizing needs something to compare against
+        return 0
+
+    scores = factor_scores(feature_matrix(infos, loadings.names), loadings.matrix)
+    updates = []
+    for run_id, factor, row in zip(ids, factors, scores):
+        fit = rank = None
+        try:
+            weights = loadings.weights(factor) if factor else None
+        except ValueError:
+            weights = None
+        if weights is not None:
+            fit = round(float(row @ weights), 3)
+            if len(parse_target(factor)) == 1:
+                k = int(np.argmax(weights != 0))
+                rank = int((row > row[k]).sum()) + 1
+        updates.append((json.dumps({str(k + 1): round(float(v), 3) for k, v in enumerate(row)}),
+                        fit, rank, run_id))
+    with contextlib.closing(sqlite3.connect(manifest.path)) as con, con:
+        con.executemany("UPDATE runs SET factor_scores = ?, factor_fit = ?, factor_rank = ? WHERE id = ?", updates)
+    return len(updates)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Score rendered charts against the factor loadings, from their text sidecars.")
+    parser.add_argument("sidecars", nargs="*", help="*_text.json files; without them, score the manifest")
+    parser.add_argument("--db", default="manifest.sqlite")
+    parser.add_argument("--loadings", default="prompts/loadings.json")
+    args = parser.parse_args(argv)
+
+    loadings = Loadings.from_file(args.loadings)
+    start = time.perf_counter()
+    if not args.sidecars:
+        n = score_runs(Manifest(args.db), loadings)
+        print(f"Scored {n} charts in {time.perf_counter() - start:.2f} s "
+              f"(python code/manifest.py --db {args.db} fit for the summary).")
+        return
+
+    infos = []
+    for fname in args.sidecars:
+        with open(fname, "r", encoding="utf-8") as f:
+            infos.append(json.load(f))
+    scores = factor_scores(feature_matrix(infos, loadings.names), loadings.matrix)
+    print(f"{'chart':<40}" + "".join(f"{'F' + str(k + 1):>8}" for k in range(loadings.n_factors)) + "   best")
+    for fname, row in sorted(zip(args.sidecars, scores), key=lambda p: -p[1].max()):
+        name = os.path.basename(fname).replace("_design_text.json", "")
+        print(f"{name:<40}" + "".join(f"{v:>8.2f}" for v in row) + f"   F{int(row.argmax()) + 1}")
+    print(f"Scored {len(infos)} charts in {time.perf_counter() - start:.2f} s.")
+
+
+if __name__ == "__main__":
+    main()
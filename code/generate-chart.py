@@ -1,16 +1,94 @@
 import os
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+import asyncio
 import subprocess
 import time
 import json
 from dotenv import load_dotenv
 import re
+import contextvars
+import threading
+import hashlib
+
+from llm_cache import cache_from_env, CACHE_VARIANT
+from rate_limit import limiter_from_env, estimate_tokens, used_tokens, RETRYABLE
+from render_pool import RenderPool
+from code_check import check_code, find_banned, load_deny_list
+from stream_fence import FenceExtractor, IncompleteStream
+from auto_repair import AutoRepair, retarget_output
+from design_spec import load_schema, parse_spec, renderer_supports, draw_spec
+from stage_pipeline import Stage, StagedPipeline
+from batch_mode import run_batch, output_text
+from hedge import HedgeStats, race
+from build_stamps import BuildStamps, input_hash, file_hash
+from manifest import Manifest, error_signature, parse_img_name
+from tracing import Tracer, current_span
+from artifacts import encode_artifacts
+from text_sidecar import sidecar_fname
+from layout_check import check_layout, format_issues
+from factor_score import score_runs
+from loadings import Loadings, target_label, THRESHOLD
 
 MAX_RETRIES = 3
+# deterministic local fixes to try per attempt before calling the recoder
+MAX_LOCAL_REPAIRS = 3
+MODEL = "gpt-5-mini"
+REASONING_EFFORT = "medium"
+# how many pipelines the sweep driver keeps in flight at once
+SWEEP_CONCURRENCY = int(os.getenv("SWEEP_CONCURRENCY", "4"))
+# "staged" runs plan/codegen/check/render/recode as separate worker stages with queues
+# between them; "pipelines" runs each pipeline start to finish as a single task;
+# "batch" sends every design-plan and chart-code request through the Batch API first
+SWEEP_MODE = os.getenv("SWEEP_MODE", "staged")
+# where batch input files are written, and how often to poll a submitted batch
+BATCH_DIR = os.getenv("BATCH_DIR", ".batches")
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "30"))
+# warm render workers to keep around; 0 falls back to a fresh interpreter per render
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_POOL = None
+# validate every attempt with a cheap low-DPI render on the pool and only do the 300 dpi
+# raster and PNG encode for the attempt that is accepted
+TWO_TIER_RENDER = os.getenv("TWO_TIER_RENDER", "1") == "1"
+# re-encode accepted charts as optimized PNG plus a thumbnail pyramid, and a lossless WebP on request
+COMPACT_ARTIFACTS = os.getenv("COMPACT_ARTIFACTS", "1") == "1"
+ARTIFACT_WEBP = os.getenv("ARTIFACT_WEBP", "0") == "1"
+# send charts whose text overlaps or runs off the figure back to the recoder. Off until the
+# thresholds are tuned: nearly every recorded chart has some issue, so the gate would recode
+# them all. The issue count goes into the manifest (layout_issues) either way
+LAYOUT_CHECK = os.getenv("LAYOUT_CHECK", "0") == "1"
+# "prose" asks for a free-text design plan; "spec" asks for a JSON design spec that
+# the built-in renderer can draw without a code-generation call
+DESIGN_MODE = os.getenv("DESIGN_MODE", "prose")
+# stream chart-code responses, stop reading once the code fence closes, and cancel
+# a response as soon as it writes a deny-listed construct
+STREAM_CODE = os.getenv("STREAM_CODE", "1") == "1"
+MAX_STREAM_RESTARTS = 2
+# once the code fence closes, how long to wait for the response to report completion; code
+# from a stream that never does is still used but not cached
+STREAM_TAIL_SECONDS = 2.0
+# chart-code candidates (and fixes) to request and render in parallel; the first one
+# that passes the static check and renders wins, the rest are cancelled. 1 turns this off
+HEDGE_K = int(os.getenv("HEDGE_K", "1"))
+HEDGE_STATS = HedgeStats()
+# skip stages whose inputs have not changed since the last run; INCREMENTAL=0 rebuilds everything
+STAMPS = BuildStamps(enabled=os.getenv("INCREMENTAL", "1") == "1")
+# every finished pipeline is written to this SQLite manifest, see `python code/manifest.py -h`
+MANIFEST = Manifest(os.getenv("MANIFEST_DB", "manifest.sqlite"))
+SWEEP_ID = None
+# spans for every stage and request go to TRACE_DIR/<sweep id>.jsonl; TRACE_DIR="" turns this off
+TRACE_DIR = os.getenv("TRACE_DIR", ".traces")
+TRACER = Tracer()
+# the running pipeline's token counters; stages set it so API calls can add their usage
+TOKEN_USAGE = contextvars.ContextVar("TOKEN_USAGE", default=None)
 
 with open("prompts/design-description.txt", "r", encoding="utf-8") as f:
     DESIGN_PROMPT = f.read()
 
+DESIGN_SPEC_SCHEMA = load_schema("prompts/design-spec.schema.json")
+
+with open("prompts/design-spec.txt", "r", encoding="utf-8") as f:
+    DESIGN_SPEC_PROMPT = f.read() + json.dumps(DESIGN_SPEC_SCHEMA, indent=2)
+
 with open("prompts/generate-chart.txt", "r", encoding="utf-8") as f:
     CHART_PROMPT = f.read()
 
@@ -19,6 +97,26 @@ with open("prompts/recode.txt", "r", encoding="utf-8") as f:
 
 with open("prompts/loadings.json", "r") as f:
     LOADINGS = json.load(f)
+FACTOR_LOADINGS = Loadings(LOADINGS)
+
+# the start of every design-plan prompt, the same bytes on every call: together with the system
+# prompt it is a prefix the provider can serve from its prompt cache (only prefixes of 1024+
+# tokens are cached). The per-factor loadings and the data go after it
+DESIGN_PREFIX = f"""Make a design plan for this data that fits with the attached variable loadings. 
+        It should be a paired bar chart over the x-axis of time and be in at least a 3:4 aspect ratio (taller than it is wide).
+        Make the text large enough to see in a presentation.
+
+        VARIABLES (name (category): definition):
+{FACTOR_LOADINGS.glossary()}
+"""
+
+DENY_LIST = load_deny_list("prompts/deny-list.json")
+REPAIRER = AutoRepair()
+
+# shared response cache, see LLM_CACHE_MODE / LLM_CACHE_DIR / LLM_CACHE_MAX_MB
+CACHE = cache_from_env()
+# shared request/token budgets and adaptive concurrency, see OPENAI_RPM / OPENAI_TPM
+LIMITER = limiter_from_env()
 
 
 chart_image1 = """
@@ -77,10 +175,58 @@ chart_image2 = """
     """
 
 
+def add_usage(input_tokens, output_tokens, cached_tokens=0):
+    # cached_tokens is the part of input_tokens served from the provider's prompt cache
+    tokens = TOKEN_USAGE.get()
+    if tokens is not None:
+        tokens["input"] += input_tokens or 0
+        tokens["output"] += output_tokens or 0
+        tokens["cached"] += cached_tokens or 0
+    span = current_span()
+    if span is not None:
+        span.add("input_tokens", input_tokens or 0)
+        span.add("output_tokens", output_tokens or 0)
+        span.add("cached_tokens", cached_tokens or 0)
+
+
+def mark_cache_hit():
+    span = current_span()
+    if span is not None:
+        span.set(cache="hit")
+
+
+def add_response_usage(usage):
+    if isinstance(usage, dict):
+        details = usage.get("input_tokens_details") or {}
+        add_usage(usage.get("input_tokens"), usage.get("output_tokens"), details.get("cached_tokens"))
+    elif usage is not None:
+        details = getattr(usage, "input_tokens_details", None)
+        add_usage(getattr(usage, "input_tokens", 0), getattr(usage, "output_tokens", 0),
+                  getattr(details, "cached_tokens", 0))
+
+
+def prompt_cache_key(system_prompt) -> str:
+    """
+    Routing hint so requests that share a system prompt (and so a prompt prefix) reach the same cache.
+    """
+    return "chart-" + hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+
+
 def call_gpt5mini(system_prompt: str, user_prompt: str, image_path: str = None) -> str:
     """
     Call GPT-5 with optional image input using the official OpenAI client.
     """
+    image_bytes = None
+    if image_path:
+        with open(image_path, "rb") as f:
+            image_bytes = f.read()
+
+    key = CACHE.key(MODEL, system_prompt, user_prompt, image_bytes, REASONING_EFFORT)
+    cached = CACHE.lookup(key)
+    if cached is not None:
+        mark_cache_hit()
+        return cached
+
     input_payload = [
         {"role": "system", "content": [
             {"type": "input_text", "text": system_prompt}]},
@@ -97,15 +243,167 @@ def call_gpt5mini(system_prompt: str, user_prompt: str, image_path: str = None)
             {"type": "input_image", "file_id": img_obj.id}
         )
 
-    response = client.responses.create(
-        model="gpt-5-mini",
+    response = LIMITER.call(
+        client.responses.create,
+        estimate_tokens(system_prompt, user_prompt),
+        model=MODEL,
         input=input_payload,
-        reasoning={"effort": "medium"}
+        reasoning={"effort": REASONING_EFFORT},
+        prompt_cache_key=prompt_cache_key(system_prompt)
     )
 
+    add_response_usage(getattr(response, "usage", None))
+    CACHE.store(key, response.output_text, model=MODEL)
     return response.output_text
 
 
+async def call_gpt5mini_async(system_prompt: str, user_prompt: str, image_path: str = None) -> str:
+    """
+    Async version of call_gpt5mini using the AsyncOpenAI client.
+    """
+    image_bytes = None
+    if image_path:
+        with open(image_path, "rb") as f:
+            image_bytes = f.read()
+
+    key = CACHE.key(MODEL, system_prompt, user_prompt, image_bytes, REASONING_EFFORT)
+    cached = CACHE.lookup(key)
+    if cached is not None:
+        mark_cache_hit()
+        return cached
+
+    input_payload = [
+        {"role": "system", "content": [
+            {"type": "input_text", "text": system_prompt}]},
+        {"role": "user", "content": [
+            {"type": "input_text", "text": user_prompt}]}
+    ]
+
+    # If an image is included, append it
+    if image_path:
+        with open(image_path, "rb") as f:
+            img_obj = await aclient.files.create(file=f, purpose="vision")
+
+        input_payload[1]["content"].append(
+            {"type": "input_image", "file_id": img_obj.id}
+        )
+
+    response = await LIMITER.call_async(
+        aclient.responses.create,
+        estimate_tokens(system_prompt, user_prompt),
+        model=MODEL,
+        input=input_payload,
+        reasoning={"effort": REASONING_EFFORT},
+        prompt_cache_key=prompt_cache_key(system_prompt)
+    )
+
+    add_response_usage(getattr(response, "usage", None))
+    CACHE.store(key, response.output_text, model=MODEL)
+    return response.output_text
+
+
+async def stream_code_async(system_prompt: str, user_prompt: str, img_name: str) -> str:
+    """
+    Stream a chart-code response and return the fenced code once the fence closes.
+    A deny-listed construct mid-stream cancels the request and retries it straight away
+    with the rule added to the prompt. A stream that fails or ends before the code is
+    complete raises IncompleteStream, which is retried like a dropped connection.
+    """
+    key = CACHE.key(MODEL, system_prompt, user_prompt, None, REASONING_EFFORT)
+    cached = CACHE.lookup(key)
+    if cached is not None:
+        mark_cache_hit()
+        return cached
+
+    prompt = user_prompt
+    restarts = 0
+    attempt = 0
+    while True:
+        fence = FenceExtractor()
+        banned = None
+        scanned = 0
+        status = None
+        input_payload = [
+            {"role": "system", "content": [
+                {"type": "input_text", "text": system_prompt}]},
+            {"role": "user", "content": [
+                {"type": "input_text", "text": prompt}]}
+        ]
+        try:
+            async with LIMITER.slot_async(estimate_tokens(system_prompt, prompt)) as usage:
+                stream = await aclient.responses.create(
+                    model=MODEL,
+                    input=input_payload,
+                    reasoning={"effort": REASONING_EFFORT},
+                    prompt_cache_key=prompt_cache_key(system_prompt),
+                    stream=True
+                )
+                events = stream.__aiter__()
+                deadline = None
+                try:
+                    while status is None:
+                        try:
+                            if deadline is None:
+                                event = await events.__anext__()
+                            else:
+                                event = await asyncio.wait_for(
+                                    events.__anext__(), max(deadline - time.monotonic(), 0.0))
+                        except (StopAsyncIteration, asyncio.TimeoutError):
+                            break
+                        if event.type == "response.output_text.delta" and deadline is None:
+                            fence.feed(event.delta)
+                            lines = fence.complete_lines()
+                            # only rescan when another line has finished
+                            if restarts < MAX_STREAM_RESTARTS and len(lines) > scanned:
+                                scanned = len(lines)
+                                hits = find_banned(lines, DENY_LIST)
+                                if hits:
+                                    banned = hits[0]
+                                    break
+                            if fence.closed:
+                                # the code is all here; only wait a moment for the completion
+                                deadline = time.monotonic() + STREAM_TAIL_SECONDS
+                        elif event.type == "response.completed":
+                            status = "completed"
+                            usage["tokens"] = used_tokens(event.response)
+                            add_response_usage(getattr(event.response, "usage", None))
+                        elif event.type in ("response.failed", "response.incomplete", "error"):
+                            status = event.type
+                finally:
+                    # stops the download (and generation) of whatever is left
+                    await stream.close()
+                    if usage["tokens"] is None:
+                        # cut off before the usage report, so count what we sent and saw
+                        add_usage(estimate_tokens(system_prompt, prompt, expected_output=0),
+                                  len(fence.text) // 4)
+            if banned is None and status != "completed" and not fence.closed:
+                raise IncompleteStream(
+                    f"Streamed code stopped before it was complete ({status or 'stream ended'}).")
+        except (*RETRYABLE, IncompleteStream) as e:
+            attempt += 1
+            if attempt >= LIMITER.max_attempts:
+                raise
+            await asyncio.sleep(LIMITER.backoff(e, attempt))
+            continue
+
+        if banned is None:
+            break
+        restarts += 1
+        lineno, message = banned
+        span = current_span()
+        if span is not None:
+            span.set(restarts=restarts, cancelled_for=message)
+        print(f"[{img_name}] Cancelled streamed code at line {lineno}: {message} Retrying.")
+        prompt = f"{user_prompt}\n\n        IMPORTANT: {message}"
+
+    code = fence.code()
+    # only a finished response with all of its code goes in the cache, under the original
+    # prompt so a replay does not depend on the restarts
+    if status == "completed" and (fence.closed or fence.code_start is None):
+        CACHE.store(key, code, model=MODEL)
+    return code
+
+
 def extract_gpt5_text(result: dict) -> str:
     """
     Parse GPT-5 API result to extract the first assistant text output.
@@ -129,41 +427,159 @@ def extract_gpt5_text(result: dict) -> str:
         return f"Error parsing response: {e}"
 
 
+def design_plan_prompt(chart_data, factor) -> str:
+    # a factor number or a blend such as "0.7*F2 + 0.3*F4". Only what changes per call follows
+    # the shared prefix: the loadings as a terse table, then the data
+    user_prompt = f"""{DESIGN_PREFIX}
+        LOADINGS (name: loading, for the variables with |loading| > {THRESHOLD}):
+{FACTOR_LOADINGS.table(factor)}
+
+        DATA:
+        {chart_data}"""
+    return user_prompt
+
+
 def design_plan_factor(chart_data, factor) -> str:
+    response = call_gpt5mini(DESIGN_PROMPT, design_plan_prompt(chart_data, factor))
+    return response
 
-    # filter the json file
-    loadings = {
-        key: {
-            "Category": value.get("Category"),
-            "Definition": value.get("Definition"),
-            "Loading": value.get(f"Factor {factor}")
-        }
-        for key, value in LOADINGS.items()
-        # if value.get("Category") != "Source"
-        if abs(value.get(f"Factor {factor}")) > 0.2
-    }
 
-    user_prompt = f"""Make a design plan for this data that fits with the attached variable loadings. 
-        It should be a paired bar chart over the x-axis of time and be in at least a 3:4 aspect ratio (taller than it is wide).
-        Make the text large enough to see in a presentation.
+async def design_plan_factor_async(chart_data, factor) -> str:
+    response = await call_gpt5mini_async(DESIGN_PROMPT, design_plan_prompt(chart_data, factor))
+    return response
 
-        LOADINGS:   
-        {loadings}
 
-        DATA:
-        {chart_data}"""
-    response = call_gpt5mini(DESIGN_PROMPT, user_prompt)
+async def design_spec_factor_async(chart_data, factor) -> str:
+    response = await call_gpt5mini_async(DESIGN_SPEC_PROMPT, design_plan_prompt(chart_data, factor))
     return response
 
 
-def generate_chart(design_plan, chart_info) -> str:
+async def render_design_spec(design_plan, spec_fname, image_fname, img_name):
+    """
+    Draw a JSON design spec with the built-in renderer.
+    Returns (True, text layout) or (False, reason), where a failure means the pipeline should
+    fall back to code generation.
+    """
+    try:
+        spec = parse_spec(design_plan, DESIGN_SPEC_SCHEMA)
+    except ValueError as e:
+        return False, str(e)
+    if not renderer_supports(spec):
+        return False, f"The built-in renderer does not draw '{spec['chart_type']}' charts."
+
+    with open(spec_fname, "w") as f:
+        json.dump(spec, f, indent=2)
+
+    if RENDER_POOL is not None:
+        result = await RENDER_POOL.run_spec_async(spec_fname, image_fname)
+        if result.returncode != 0:
+            return False, result.stderr
+        info = rendered_layout(result, image_fname)
+    else:
+        try:
+            info = await asyncio.to_thread(draw_spec, spec, image_fname)
+        except Exception as e:
+            return False, repr(e)
+
+    print(f"[{img_name}] Rendered the design spec directly.")
+    return True, info
+
+
+def plan_inputs(job) -> str:
+    system_prompt = DESIGN_SPEC_PROMPT if DESIGN_MODE == "spec" else DESIGN_PROMPT
+    # the user prompt carries the filtered loadings and the data; img_name keeps repeated runs apart
+    return input_hash(MODEL, REASONING_EFFORT, system_prompt,
+                      design_plan_prompt(job["image_info"], job["factor"]), job["img_name"])
+
+
+def code_inputs(job) -> str:
+    # recode.txt counts too, since the final script may have come out of the recoder
+    return input_hash(MODEL, REASONING_EFFORT, CHART_PROMPT, RECODE_PROMPT,
+                      chart_prompt(job["design_plan"], job["image_info"]),
+                      file_hash(job["design_plan_fname"]))
+
+
+def image_inputs(job) -> str:
+    if job["code_response"] is None:
+        return input_hash("spec", file_hash(job["design_plan_fname"]))
+    return input_hash("code", file_hash(job["code_fname"]))
+
+
+def rendered_layout(result, image_fname):
+    """
+    The text layout the render that just ran reported for image_fname, or None.
+    Subprocess renders report none, so they go without a layout check.
+    """
+    return getattr(result, "texts", {}).get(os.path.abspath(image_fname))
+
+
+def layout_error(job, info):
+    """
+    The text overlaps and clipping of a rendered chart as an error for the recoder, or None.
+    The last attempt is never failed over layout alone: a cluttered chart beats no chart.
+    """
+    if not LAYOUT_CHECK or info is None or job["attempt"] >= MAX_RETRIES - 1:
+        return None
+    issues = check_layout(info)
+    return format_issues(issues, info) if issues else None
+
+
+def text_path(job):
+    """
+    The sidecar that belongs to the job's image, or None when there is no layout data for it.
+    A render this run reported its layout or wrote nothing (subprocess renders); an up-to-date
+    image keeps the sidecar written with it.
+    """
+    fname = sidecar_fname(job["image_fname"])
+    if job["layout_info"] is None and job["first_render"] is not None:
+        return None
+    return fname if os.path.exists(fname) else None
+
+
+async def accept_outputs(job):
+    """
+    Final output stage for an accepted chart: compact the image, then stamp code and image.
+    """
+    info = job["layout_info"]
+    job["layout_issues"] = len(check_layout(info)) if info is not None else None
+    if COMPACT_ARTIFACTS:
+        with TRACER.span("encode", webp=ARTIFACT_WEBP) as span:
+            job["artifacts"] = await asyncio.to_thread(encode_artifacts, job["image_fname"], ARTIFACT_WEBP)
+            span.set(raw_png_bytes=job["artifacts"]["raw_png_bytes"], png_bytes=job["artifacts"]["png_bytes"])
+    stamp_outputs(job)
+
+
+def stamp_outputs(job):
+    """
+    Stamp the code and image of a job that just rendered successfully.
+    """
+    if job["code_response"] is not None:
+        STAMPS.record(job["code_fname"], code_inputs(job))
+    STAMPS.record(job["image_fname"], image_inputs(job))
+
+
+def chart_prompt(design_plan, chart_info) -> str:
+    # most-shared first for the prompt cache: the data is the same for every plan of a dataset
     user_prompt = f"""Write code for a chart that follows the given design plan. 
-                    {design_plan}
                     
                     Here is the chart data.
                     {chart_info}
+
+                    Here is the design plan.
+                    {design_plan}
         """
-    response = call_gpt5mini(CHART_PROMPT, user_prompt)
+    return user_prompt
+
+
+def generate_chart(design_plan, chart_info) -> str:
+    response = call_gpt5mini(CHART_PROMPT, chart_prompt(design_plan, chart_info))
+    return response
+
+
+async def generate_chart_async(design_plan, chart_info, img_name=None) -> str:
+    if STREAM_CODE:
+        return await stream_code_async(CHART_PROMPT, chart_prompt(design_plan, chart_info), img_name)
+    response = await call_gpt5mini_async(CHART_PROMPT, chart_prompt(design_plan, chart_info))
     return response
 
 
@@ -188,7 +604,7 @@ def clean_code_response(code_response, img_name):
     return clean_code
 
 
-def regenerate_chart_code(code, error):
+def recode_prompt(code, error) -> str:
     user_prompt = f"""The following Python code failed with an error. 
         Fix the error and return updated code that will run successfully.
         It should be a paired bar chart over the x-axis of time and be in at least a 3:4 aspect ratio (taller than it is wide).
@@ -200,77 +616,711 @@ def regenerate_chart_code(code, error):
 
         Return the updated code.
         """
-    response = call_gpt5mini(RECODE_PROMPT, user_prompt)
+    return user_prompt
+
+
+def regenerate_chart_code(code, error):
+    response = call_gpt5mini(RECODE_PROMPT, recode_prompt(code, error))
     return response
 
 
-def run_pipeline(image_info, factor, img_name):
+async def regenerate_chart_code_async(code, error, img_name=None):
+    if STREAM_CODE:
+        return await stream_code_async(RECODE_PROMPT, recode_prompt(code, error), img_name)
+    response = await call_gpt5mini_async(RECODE_PROMPT, recode_prompt(code, error))
+    return response
+
+
+async def run_chart_script(code_fname, accept=None):
+    """
+    Run a generated chart script without blocking the event loop.
+    Returns a CompletedProcess just like subprocess.run(capture_output=True, text=True).
+    With two-tier rendering on the pool, `accept(result)` decides after the draft pass whether
+    the full-quality files get written. Cancelling the call kills the script's worker or process.
+    """
+    if RENDER_POOL is not None and TWO_TIER_RENDER:
+        return await RENDER_POOL.run_two_tier_async(code_fname, accept)
+    if RENDER_POOL is not None:
+        return await RENDER_POOL.run_async(code_fname)
+
+    # chart scripts may import the helpers that live next to this file (chart_labels)
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in (here, os.getenv("PYTHONPATH")) if p))
+    proc = await asyncio.create_subprocess_exec(
+        "python", code_fname,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=env
+    )
+    try:
+        stdout, stderr = await proc.communicate()
+    except asyncio.CancelledError:
+        proc.kill()
+        await proc.wait()
+        raise
+    return subprocess.CompletedProcess(
+        ["python", code_fname], proc.returncode,
+        stdout.decode(errors="replace"), stderr.decode(errors="replace")
+    )
+
+
+def new_job(image_info, factor, img_name) -> dict:
+    """
+    Per-pipeline state handed from stage to stage.
+    Raises ValueError for a factor target the loadings cannot score.
+    """
+    FACTOR_LOADINGS.weights(factor)
+    return {
+        "image_info": image_info,
+        # 2 stays 2; blends get one canonical spelling, e.g. "0.7*F2+0.3*F4"
+        "factor": target_label(factor),
+        "img_name": img_name,
+        "design_plan_fname": f"generated/{img_name}/{img_name}_design_plan.txt",
+        "spec_fname": f"generated/{img_name}/{img_name}_design_spec.json",
+        "code_fname": f"generated/{img_name}/{img_name}_chart_code.py",
+        "image_fname": f"generated/{img_name}/{img_name}_design.png",
+        "design_plan": None,
+        "code_response": None,
+        "last_error": None,
+        "attempt": -1,
+        "local_repairs": 0,
+        "pending_rule": None,
+        "success": False,
+        "start": time.time(),
+        "design_end": None,
+        "first_render": None,
+        "timings": {},
+        "tokens": {"input": 0, "output": 0, "cached": 0},
+        "errors": [],
+        "local_repairs_total": 0,
+        "artifacts": None,
+        "layout_info": None,
+        "layout_issues": None,
+    }
+
+
+async def stage_plan(job):
+    img_name = job["img_name"]
+    CACHE_VARIANT.set(img_name)
 
     # make directory
     os.makedirs(os.path.join("generated", img_name), exist_ok=True)
-
-    start = time.time()
     print(
-        f"\n--- Beginning work on creating image for factor {factor}. {img_name}. ---")
+        f"\n--- Beginning work on creating image for factor {job['factor']}. {img_name}. ---")
+
+    inputs = plan_inputs(job)
+    if STAMPS.fresh(job["design_plan_fname"], inputs, "plan"):
+        with open(job["design_plan_fname"], "r") as f:
+            job["design_plan"] = f.read()
+        job["design_end"] = time.time()
+        print(f"[{img_name}] Design plan is up to date.")
+        if DESIGN_MODE == "spec" and STAMPS.fresh(job["image_fname"], image_inputs(job), "render"):
+            print(f"[{img_name}] Image is up to date.")
+            job["success"] = True
+            return None
+        return "render" if DESIGN_MODE == "spec" else "codegen"
 
-    # Step 1: design plan
-    design_plan = design_plan_factor(image_info, factor)
-    design_end = time.time()
+    with TRACER.span("llm.plan", mode=DESIGN_MODE):
+        if DESIGN_MODE == "spec":
+            design_plan = await design_spec_factor_async(job["image_info"], job["factor"])
+        else:
+            design_plan = await design_plan_factor_async(job["image_info"], job["factor"])
+    job["design_plan"] = design_plan
+    job["design_end"] = time.time()
     print(
-        f"Made design plan. Took {round(design_end - start, 1)} seconds to complete.")
-    # print(design_plan)
+        f"[{img_name}] Made design plan. Took {round(job['design_end'] - job['start'], 1)} seconds to complete.")
     # save the design plan
-    design_plan_fname = f"generated/{img_name}/{img_name}_design_plan.txt"
-    with open(design_plan_fname, "w") as f:
+    with TRACER.span("write"), open(job["design_plan_fname"], "w") as f:
         f.write(design_plan)
+    STAMPS.record(job["design_plan_fname"], inputs)
 
-    # Step 2: generate + run chart with retries
-    # write the code for the chart, allowing for retrying if the code does not work
-    code_response_raw = None
-    last_error = None
-    for attempt in range(0, MAX_RETRIES):
-        print(f"--- Attempt {attempt} at constructing chart code---")
+    # specs the built-in renderer understands skip code generation and its retry loop
+    return "render" if DESIGN_MODE == "spec" else "codegen"
 
-        # Generate code
-        if attempt == 0:
-            code_response_raw = generate_chart(design_plan, image_info)
-        else:
-            print("Calling recoder to fix the error.")
-            code_response_raw = regenerate_chart_code(
-                code_response_raw, last_error)
-
-        code_response = clean_code_response(code_response_raw, img_name)
-
-        # save the returned code
-        code_fname = f"generated/{img_name}/{img_name}_chart_code.py"
-        with open(code_fname, "w") as f:
-            f.write(code_response)
-        # run the returned code
-        chart_code = subprocess.run(
-            ["python", code_fname],
-            capture_output=True,
-            text=True
-        )
 
-        if chart_code.returncode == 0:
-            print("Chart script successful!")
-            break
+async def stage_codegen(job):
+    CACHE_VARIANT.set(job["img_name"])
+    job["attempt"] = 0
+    if STAMPS.fresh(job["code_fname"], code_inputs(job), "code"):
+        with open(job["code_fname"], "r") as f:
+            job["code_response"] = f.read()
+        print(f"[{job['img_name']}] Chart code is up to date.")
+        if STAMPS.fresh(job["image_fname"], image_inputs(job), "render"):
+            print(f"[{job['img_name']}] Image is up to date.")
+            job["success"] = True
+            return None
+        return "check"
+    print(f"[{job['img_name']}] --- Attempt 0 at constructing chart code---")
+    if HEDGE_K > 1:
+        return await hedge_code(
+            job, lambda: generate_chart_async(job["design_plan"], job["image_info"], job["img_name"]))
+    with TRACER.span("llm.codegen", streamed=STREAM_CODE):
+        code_response_raw = await generate_chart_async(job["design_plan"], job["image_info"], job["img_name"])
+    with TRACER.span("clean"):
+        job["code_response"] = clean_code_response(code_response_raw, job["img_name"])
+    return "check"
+
+
+async def stage_check(job):
+    with TRACER.span("write"), open(job["code_fname"], "w") as f:
+        f.write(job["code_response"])
+
+    # check the code before paying for an interpreter and a render
+    with TRACER.span("check") as span:
+        static_error = check_code(job["code_response"], job["code_fname"], DENY_LIST)
+        span.set(passed=static_error is None)
+    if static_error:
+        print(f"[{job['img_name']}] Static check failed!")
+        job["last_error"] = static_error
+        return route_failure(job)
+    return "render"
+
+
+async def stage_render(job):
+    img_name = job["img_name"]
+    if job["first_render"] is None:
+        job["first_render"] = time.time()
+    # a sidecar left over from an earlier render must not stand in for this one
+    remove_files(sidecar_fname(job["image_fname"]))
+    job["layout_info"] = None
+
+    if job["code_response"] is None:
+        with TRACER.span("render.spec") as span:
+            success, value = await render_design_spec(
+                job["design_plan"], job["spec_fname"], job["image_fname"], img_name)
+            span.set(success=success)
+        if success:
+            job["success"] = True
+            job["layout_info"] = value
+            await accept_outputs(job)
+            return None
+        print(f"[{img_name}] Falling back to code generation: {value}")
+        return "codegen"
+
+    layout = {}
+
+    def accept(result):
+        # after the draft pass: only lay out the full-quality image if it was saved and its text layout is fine
+        if os.path.abspath(job["image_fname"]) not in result.saved:
+            return False
+        layout["error"] = layout_error(job, rendered_layout(result, job["image_fname"]))
+        return layout["error"] is None
+
+    # run the returned code
+    render_start = time.time()
+    with TRACER.span("render", pooled=RENDER_POOL is not None) as span:
+        chart_code = await run_chart_script(job["code_fname"], accept=accept)
+        wrote_image = (os.path.exists(job["image_fname"])
+                       and os.path.getmtime(job["image_fname"]) >= render_start - 1)
+        if chart_code.returncode == 0 and wrote_image:
+            job["layout_info"] = rendered_layout(chart_code, job["image_fname"])
+            if "error" not in layout:
+                layout["error"] = layout_error(job, job["layout_info"])
+        span.set(returncode=chart_code.returncode, wrote_image=wrote_image, layout_ok=not layout.get("error"))
+
+    if chart_code.returncode == 0 and wrote_image and not layout.get("error"):
+        print(f"[{img_name}] Chart script successful!")
+        if job["pending_rule"]:
+            REPAIRER.record(job["pending_rule"], True)
+        job["success"] = True
+        await accept_outputs(job)
+        return None
+
+    if layout.get("error"):
+        print(f"[{img_name}] Chart script ran, but its text overlaps or is clipped.")
+        job["last_error"] = layout["error"]
+    elif chart_code.returncode == 0:
+        job["last_error"] = f"The script ran but did not write {job['image_fname']}."
+    else:
+        print(f"[{img_name}] Chart script failed!")
+        job["last_error"] = chart_code.stderr
+    return route_failure(job)
+
+
+def route_failure(job):
+    """
+    Decide where a failed attempt goes next: a local repair, the recoder, or nowhere.
+    """
+    img_name = job["img_name"]
+    job["errors"].append((job["attempt"], error_signature(job["last_error"])))
+    if job["pending_rule"]:
+        REPAIRER.record(job["pending_rule"], False)
+        job["pending_rule"] = None
+
+    # try cheap deterministic fixes before paying for another LLM round trip
+    if job["local_repairs"] < MAX_LOCAL_REPAIRS:
+        repaired = REPAIRER.repair(
+            job["code_response"], job["last_error"], job["code_fname"], job["image_fname"])
+        if repaired is not None:
+            job["code_response"], job["pending_rule"] = repaired
+            job["local_repairs"] += 1
+            job["local_repairs_total"] += 1
+            print(f"[{img_name}] Applied local repair '{job['pending_rule']}'.")
+            return "check"
+
+    print("stderr:", job["last_error"])
+    if job["attempt"] >= MAX_RETRIES - 1:
+        print(f"[{img_name}] All retries failed. Giving up.")
+        with open(f"generated/{img_name}/{img_name}_failed_code.py", "w") as cf:
+            cf.write(job["code_response"])
+        return None
+    return "recode"
+
+
+async def stage_recode(job):
+    CACHE_VARIANT.set(job["img_name"])
+    job["attempt"] += 1
+    job["local_repairs"] = 0
+    print(f"[{job['img_name']}] --- Attempt {job['attempt']} at constructing chart code---")
+    print(f"[{job['img_name']}] Calling recoder to fix the error.")
+    if HEDGE_K > 1:
+        code, error = job["code_response"], job["last_error"]
+        return await hedge_code(
+            job, lambda: regenerate_chart_code_async(code, error, job["img_name"]))
+    with TRACER.span("llm.recode", streamed=STREAM_CODE, error=error_signature(job["last_error"])):
+        code_response_raw = await regenerate_chart_code_async(
+            job["code_response"], job["last_error"], job["img_name"])
+    with TRACER.span("clean"):
+        job["code_response"] = clean_code_response(code_response_raw, job["img_name"])
+    return "check"
+
+
+def remove_files(*fnames):
+    for fname in fnames:
+        if os.path.exists(fname):
+            os.remove(fname)
+
+
+async def hedged_candidate(job, i, request, claim):
+    """
+    Request, check and render candidate i next to the real output files.
+    Returns (True, (code, code_fname, image_fname, text layout)) when it rendered, else (False, (code, error)).
+    With two-tier rendering only the first candidate to `claim()` the win gets a full-quality render.
+    """
+    img_name = job["img_name"]
+    # candidate 0 shares the cache slot of an unhedged run; the others get their own
+    CACHE_VARIANT.set(img_name if i == 0 else f"{img_name}#{i}")
+    with TRACER.span("llm.candidate", candidate=i, streamed=STREAM_CODE):
+        code = clean_code_response(await request(), img_name)
+
+    error = check_code(code, job["code_fname"], DENY_LIST)
+    if error:
+        return False, (code, error)
+
+    cand_code = f"generated/{img_name}/{img_name}_chart_code_c{i}.py"
+    cand_image = f"generated/{img_name}/{img_name}_design_c{i}.png"
+    with open(cand_code, "w") as f:
+        f.write(retarget_output(code, cand_image))
+    remove_files(sidecar_fname(cand_image))
+
+    layout = {}
+
+    def accept(result):
+        if os.path.abspath(cand_image) not in result.saved:
+            return False
+        layout["error"] = layout_error(job, rendered_layout(result, cand_image))
+        return layout["error"] is None and claim()
+
+    if job["first_render"] is None:
+        job["first_render"] = time.time()
+    render_start = time.time()
+    with TRACER.span("render", candidate=i, pooled=RENDER_POOL is not None) as span:
+        try:
+            result = await run_chart_script(cand_code, accept=accept)
+        except asyncio.CancelledError:
+            # a lost race: the render's worker or process is gone by now, so nothing writes these any more
+            remove_files(cand_code, cand_image, sidecar_fname(cand_image))
+            raise
+        span.set(returncode=result.returncode)
+
+    wrote_image = os.path.exists(cand_image) and os.path.getmtime(cand_image) >= render_start - 1
+    info = rendered_layout(result, cand_image)
+    if result.returncode == 0 and wrote_image and "error" not in layout:
+        layout["error"] = layout_error(job, info)
+    if result.returncode == 0 and wrote_image and not layout.get("error"):
+        return True, (code, cand_code, cand_image, info)
+    remove_files(cand_code, cand_image, sidecar_fname(cand_image))
+    if layout.get("error"):
+        return False, (code, layout["error"])
+    if result.returncode == 0:
+        return False, (code, f"The script ran but did not write {job['image_fname']}.")
+    return False, (code, result.stderr.replace(cand_code, job["code_fname"]))
+
+
+async def hedge_code(job, request):
+    """
+    Speculative version of codegen/recode + check + render: HEDGE_K candidates race and the
+    first one that renders becomes the job's code. If all of them fail, the first failure
+    goes on to the usual local repair / recode route.
+    """
+    img_name = job["img_name"]
+    lock = threading.Lock()
+    winners = []
+
+    def claim():
+        # called from render threads once a draft has passed
+        with lock:
+            winners.append(True)
+            return len(winners) == 1
+
+    ok, value = await race([hedged_candidate(job, i, request, claim) for i in range(HEDGE_K)], HEDGE_STATS)
+
+    if ok:
+        code, cand_code, cand_image, job["layout_info"] = value
+        job["code_response"] = retarget_output(code, job["image_fname"])
+        with open(job["code_fname"], "w") as f:
+            f.write(job["code_response"])
+        os.replace(cand_image, job["image_fname"])
+        remove_files(sidecar_fname(job["image_fname"]))
+        if os.path.exists(sidecar_fname(cand_image)):
+            os.replace(sidecar_fname(cand_image), sidecar_fname(job["image_fname"]))
+        remove_files(cand_code)
+        print(f"[{img_name}] Chart script successful! (first of {HEDGE_K} candidates)")
+        job["success"] = True
+        await accept_outputs(job)
+        return None
+
+    failures = [v for v in value if not isinstance(v, Exception)]
+    if not failures:
+        raise value[0]
+    print(f"[{img_name}] All {HEDGE_K} candidates failed!")
+    job["code_response"], job["last_error"] = failures[0]
+    with open(job["code_fname"], "w") as f:
+        f.write(job["code_response"])
+    return route_failure(job)
 
-        if chart_code.returncode != 0:
-            print("Chart script failed!")
-            last_error = chart_code.stderr
-            print("stderr:", last_error)
-            if attempt >= MAX_RETRIES:
-                print("All retries failed. Giving up.")
-                with open(f"generated/{img_name}/{img_name}_failed_code.py", "w") as cf:
-                    cf.write(code_response)
 
-    code_end = time.time()
+def timed_stage(name, fn):
+    """
+    Wrap a stage so its time and token usage are added to the job.
+    """
+    async def run(job):
+        TOKEN_USAGE.set(job["tokens"])
+        start = time.time()
+        with TRACER.span(f"stage.{name}", lane=job["img_name"], factor=job["factor"]) as span:
+            try:
+                nxt = await fn(job)
+                span.set(next=nxt)
+                return nxt
+            finally:
+                span.set(attempt=job["attempt"])
+                job["timings"][name] = job["timings"].get(name, 0.0) + time.time() - start
+    return run
+
+
+PIPELINE_STAGES = {
+    name: timed_stage(name, fn) for name, fn in [
+        ("plan", stage_plan),
+        ("codegen", stage_codegen),
+        ("check", stage_check),
+        ("render", stage_render),
+        ("recode", stage_recode),
+    ]
+}
+
 
+def finish_job(job, error=None) -> dict:
+    end = time.time()
+    design_end = job["design_end"] or end
     print(
-        f"Wrote the code. Took {round(code_end - design_end, 1)} seconds to complete. Pipeline took {round(code_end -start, 1)} seconds total.")
+        f"[{job['img_name']}] Wrote the code. Took {round(end - design_end, 1)} seconds to complete. Pipeline took {round(end - job['start'], 1)} seconds total.")
+    result = {
+        "img_name": job["img_name"],
+        "factor": job["factor"],
+        "success": job["success"],
+        "attempts": job["attempt"] + 1,
+        "seconds": end - job["start"],
+        # time to first render: how long until anything could be drawn
+        "ttfr": job["first_render"] - job["start"] if job["first_render"] else None,
+    }
+    if error is not None:
+        result["error"] = repr(error)
+    record_manifest(job, result)
+    return result
+
+
+def record_manifest(job, result):
+    dataset, _, run_index = parse_img_name(job["img_name"])
+    timings = job["timings"]
+    MANIFEST.record({
+        "sweep_id": SWEEP_ID,
+        "img_name": job["img_name"],
+        "dataset": dataset,
+        "factor": job["factor"],
+        "run_index": run_index,
+        "model": MODEL,
+        "success": int(job["success"]),
+        "attempts": result["attempts"],
+        "local_repairs": job["local_repairs_total"],
+        "started": job["start"],
+        "total_s": result["seconds"],
+        "ttfr_s": result["ttfr"],
+        "plan_s": timings.get("plan"),
+        "codegen_s": timings.get("codegen"),
+        "check_s": timings.get("check"),
+        "render_s": timings.get("render"),
+        "recode_s": timings.get("recode"),
+        "input_tokens": job["tokens"]["input"],
+        "output_tokens": job["tokens"]["output"],
+        "cached_tokens": job["tokens"]["cached"],
+        "plan_path": job["design_plan_fname"],
+        "code_path": job["code_fname"],
+        "image_path": job["image_fname"],
+        "plan_hash": file_hash(job["design_plan_fname"]),
+        "code_hash": file_hash(job["code_fname"]),
+        "image_hash": file_hash(job["image_fname"]),
+        "png_bytes": (job["artifacts"] or {}).get("png_bytes"),
+        "raw_png_bytes": (job["artifacts"] or {}).get("raw_png_bytes"),
+        "webp_bytes": (job["artifacts"] or {}).get("webp_bytes"),
+        "thumbnails": json.dumps((job["artifacts"] or {}).get("thumbnails")),
+        "layout_issues": job["layout_issues"],
+        "text_path": text_path(job),
+        "error": result.get("error"),
+    }, job["errors"])
+
+
+async def run_pipeline_async(image_info, factor, img_name):
+    """
+    Run one pipeline start to finish, one stage after another.
+    """
+    job = new_job(image_info, factor, img_name)
+    stage = "plan"
+    while stage is not None:
+        stage = await PIPELINE_STAGES[stage](job)
+    return finish_job(job)
+
+
+async def run_pipelines_concurrently(jobs, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(image_info, factor, img_name):
+        async with semaphore:
+            try:
+                return await run_pipeline_async(image_info, factor, img_name)
+            except Exception as e:
+                # one broken pipeline should not take the whole sweep down
+                print(f"[{img_name}] Pipeline raised {type(e).__name__}: {e}")
+                return {"img_name": img_name, "factor": factor, "success": False,
+                        "attempts": 0, "seconds": 0.0, "error": repr(e)}
 
-    return
+    return await asyncio.gather(*(run_one(*job) for job in jobs))
+
+
+async def run_pipelines_staged(job_states, concurrency, first="plan"):
+    """
+    Run every job through PIPELINE_STAGES with bounded queues between stages, so one
+    factor's render overlaps the next factor's LLM requests.
+    """
+    errors = {}
+    results = {}
+
+    def on_error(stage, job, e):
+        # one broken pipeline should not take the whole sweep down
+        print(f"[{job['img_name']}] Stage {stage} raised {type(e).__name__}: {e}")
+        errors[job["img_name"]] = e
+        if stage == "done":
+            # finish_job itself failed (e.g. writing the manifest), so report the job from here
+            results[job["img_name"]] = {
+                "img_name": job["img_name"], "factor": job["factor"], "success": job["success"],
+                "attempts": job["attempt"] + 1, "seconds": time.time() - job["start"], "ttfr": None,
+                "error": repr(e)}
+
+    def on_done(job):
+        results[job["img_name"]] = finish_job(job, errors.get(job["img_name"]))
+
+    llm_workers = max(1, concurrency)
+    stages = [
+        Stage("plan", PIPELINE_STAGES["plan"], llm_workers),
+        Stage("codegen", PIPELINE_STAGES["codegen"], llm_workers),
+        Stage("check", PIPELINE_STAGES["check"], 1),
+        Stage("render", PIPELINE_STAGES["render"], max(1, RENDER_WORKERS)),
+        Stage("recode", PIPELINE_STAGES["recode"], llm_workers),
+    ]
+    pipeline = StagedPipeline(stages, first=first, max_in_flight=2 * llm_workers,
+                              on_error=on_error, on_done=on_done)
+    await pipeline.run(job_states)
+    print(pipeline.report())
+    return [results[job["img_name"]] for job in job_states]
+
+
+def batch_body(system_prompt, user_prompt) -> dict:
+    """
+    The /v1/responses request body call_gpt5mini would send, for a Batch API input line.
+    """
+    return {
+        "model": MODEL,
+        "input": [
+            {"role": "system", "content": [
+                {"type": "input_text", "text": system_prompt}]},
+            {"role": "user", "content": [
+                {"type": "input_text", "text": user_prompt}]}
+        ],
+        "reasoning": {"effort": REASONING_EFFORT},
+        "prompt_cache_key": prompt_cache_key(system_prompt),
+    }
+
+
+async def run_batch_stage(batch_client, job_states, stage, prompts_for, apply):
+    """
+    Send the `stage` request of every job waiting on that stage as one batch.
+    Cached responses are applied directly; failed requests leave the job on `stage`
+    so the online pipeline picks it up.
+    """
+    pending = []
+    for job in job_states:
+        if job["next_stage"] != stage:
+            continue
+        system_prompt, user_prompt = prompts_for(job)
+        key = CACHE.key(MODEL, system_prompt, user_prompt, None, REASONING_EFFORT,
+                        variant=job["img_name"])
+        cached = CACHE.lookup(key)
+        if cached is not None:
+            apply(job, cached)
+        else:
+            pending.append((job, key, system_prompt, user_prompt))
+
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    requests = [(f"{job['img_name']}:{stage}", batch_body(system_prompt, user_prompt))
+                for job, _, system_prompt, user_prompt in pending]
+    with TRACER.span(f"batch.{stage}", lane="batch", requests=len(requests)):
+        results, errors = await run_batch(
+            batch_client, requests, os.path.join(BATCH_DIR, f"{stage}_{int(time.time())}.jsonl"),
+            BATCH_POLL_SECONDS)
+
+    for job, key, _, _ in pending:
+        custom_id = f"{job['img_name']}:{stage}"
+        if custom_id in results:
+            # read_batch_results only keeps completed responses with output text
+            text = output_text(results[custom_id])
+            TOKEN_USAGE.set(job["tokens"])
+            add_response_usage(results[custom_id].get("usage"))
+            CACHE.store(key, text, model=MODEL)
+            apply(job, text)
+        else:
+            print(f"[{job['img_name']}] Batch {stage} request failed, will retry online: {errors.get(custom_id)}")
+
+
+async def run_batch_sweep(jobs, concurrency, batch_client=None):
+    """
+    Collect every design-plan request into one batch, then every chart-code request into a
+    second one, and hand the results to the normal check/render/recode stages.
+    """
+    batch_client = batch_client or aclient
+    job_states = [new_job(*job) for job in jobs]
+    design_prompt = DESIGN_SPEC_PROMPT if DESIGN_MODE == "spec" else DESIGN_PROMPT
+
+    def apply_plan(job, design_plan):
+        job["design_plan"] = design_plan
+        job["design_end"] = time.time()
+        with open(job["design_plan_fname"], "w") as f:
+            f.write(design_plan)
+        STAMPS.record(job["design_plan_fname"], plan_inputs(job))
+        job["next_stage"] = "render" if DESIGN_MODE == "spec" else "codegen"
+
+    def apply_code(job, code_response_raw):
+        job["attempt"] = 0
+        job["code_response"] = clean_code_response(code_response_raw, job["img_name"])
+        job["next_stage"] = "check"
+
+    for job in job_states:
+        # up-to-date plans go straight to the online stage, which skips them without a request
+        fresh = STAMPS.fresh(job["design_plan_fname"], plan_inputs(job))
+        job["next_stage"] = "online" if fresh else "plan"
+        os.makedirs(os.path.join("generated", job["img_name"]), exist_ok=True)
+
+    await run_batch_stage(
+        batch_client, job_states, "plan",
+        lambda job: (design_prompt, design_plan_prompt(job["image_info"], job["factor"])),
+        apply_plan)
+    for job in job_states:
+        if job["next_stage"] == "codegen" and STAMPS.fresh(job["code_fname"], code_inputs(job)):
+            job["next_stage"] = "online"
+    await run_batch_stage(
+        batch_client, job_states, "codegen",
+        lambda job: (CHART_PROMPT, chart_prompt(job["design_plan"], job["image_info"])),
+        apply_code)
+
+    def first_stage(job):
+        if job["next_stage"] != "online":
+            return job["next_stage"]
+        return "plan" if job["design_plan"] is None else "codegen"
+
+    return await run_pipelines_staged(job_states, concurrency, first=first_stage)
+
+
+async def run_sweep(jobs, concurrency=SWEEP_CONCURRENCY, mode=SWEEP_MODE, batch_client=None, llm_client=None):
+    """
+    Run (image_info, factor, img_name) jobs concurrently.
+    "staged" mode moves jobs through per-stage worker queues; "pipelines" mode runs at most
+    `concurrency` whole pipelines at a time; "batch" mode fetches plans and first-draft code
+    through the Batch API (or `batch_client`, e.g. a LocalBatchServer) before the staged run.
+    Either way each pipeline keeps its own step order (plan -> code -> check -> render -> recode).
+    `llm_client` replaces the AsyncOpenAI client, e.g. with a recorded-replay client for benchmarks.
+    """
+    global aclient, RENDER_POOL, SWEEP_ID, TRACER
+    SWEEP_ID = time.strftime("%Y%m%d-%H%M%S")
+    TRACER = Tracer(os.path.join(TRACE_DIR, f"{SWEEP_ID}.jsonl") if TRACE_DIR else None)
+    # the rate limiter owns retries, so the client should not retry on its own
+    aclient = llm_client or AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    if RENDER_WORKERS > 0:
+        RENDER_POOL = RenderPool(min(RENDER_WORKERS, concurrency))
+
+    start = time.time()
+    try:
+        with TRACER.span("sweep", lane="sweep", mode=mode, jobs=len(jobs), concurrency=concurrency):
+            if mode == "batch":
+                results = await run_batch_sweep(jobs, concurrency, batch_client)
+            elif mode == "staged":
+                results = await run_pipelines_staged([new_job(*job) for job in jobs], concurrency)
+            else:
+                results = await run_pipelines_concurrently(jobs, concurrency)
+    finally:
+        await aclient.close()
+        if RENDER_POOL is not None:
+            RENDER_POOL.close()
+            RENDER_POOL = None
+        TRACER.close()
+    wall = time.time() - start
+
+    report_throughput(results, wall, concurrency)
+    print(CACHE.stats())
+    print(LIMITER.stats())
+    print(REPAIRER.summary())
+    REPAIRER.save()
+    if HEDGE_K > 1:
+        print(HEDGE_STATS.summary())
+    print(STAMPS.summary())
+    _, [(input_tokens, cached_tokens)] = MANIFEST.query(
+        "SELECT SUM(input_tokens), SUM(cached_tokens) FROM runs WHERE sweep_id = ?", (SWEEP_ID,))
+    if input_tokens:
+        print(f"Prompt cache: {cached_tokens or 0} of {input_tokens} input tokens cached "
+              f"({(cached_tokens or 0) / input_tokens:.0%}, python code/manifest.py prompt-cache per factor).")
+    scored = score_runs(MANIFEST, FACTOR_LOADINGS)
+    if scored:
+        print(f"Factor fit: scored {scored} charts against the loadings "
+              f"(python code/manifest.py fit for the summary).")
+    if TRACER.path:
+        print(f"Trace written to {TRACER.path} (python code/tracing.py {TRACER.path} trace.json for a trace viewer).")
+    return results
+
+
+def report_throughput(results, wall, concurrency):
+    n_ok = sum(1 for r in results if r["success"])
+    busy = sum(r["seconds"] for r in results)
+    print("-------------------------")
+    print(f"Sweep finished: {n_ok}/{len(results)} pipelines succeeded "
+          f"in {round(wall, 1)} seconds (concurrency {concurrency}).")
+    if wall > 0:
+        print(f"Throughput: {round(len(results) / wall * 60, 2)} pipelines/minute. "
+              f"Effective parallelism: {round(busy / wall, 2)}x.")
+    ttfr = sorted(r["ttfr"] for r in results if r.get("ttfr") is not None)
+    if ttfr:
+        print(f"Time to first render: mean {round(sum(ttfr) / len(ttfr), 1)} s, "
+              f"median {round(ttfr[len(ttfr) // 2], 1)} s, max {round(ttfr[-1], 1)} s.")
+
+
+def run_pipeline(image_info, factor, img_name):
+    return asyncio.run(run_sweep([(image_info, factor, img_name)], concurrency=1, mode="pipelines"))[0]
 
 
 if __name__ == "__main__":
@@ -280,17 +1330,16 @@ if __name__ == "__main__":
     GPT_API_KEY = os.getenv("GPT_API_KEY")
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
 
+    jobs = []
     for i in range(0, 9):
-        print("-------------------------")
-        print("-------------------------")
-        print(f"--------- Run {i} ---------")
-        print("-------------------------")
-        print("-------------------------")
-        run_pipeline(chart_image1, 1, f"spain_factor1_bar{i}")
-        run_pipeline(chart_image1, 2, f"spain_factor2_bar{i}")
-        run_pipeline(chart_image1, 3, f"spain_factor3_bar{i}")
-        run_pipeline(chart_image1, 4, f"spain_factor4_bar{i}")
+        jobs.append((chart_image1, 1, f"spain_factor1_bar{i}"))
+        jobs.append((chart_image1, 2, f"spain_factor2_bar{i}"))
+        jobs.append((chart_image1, 3, f"spain_factor3_bar{i}"))
+        jobs.append((chart_image1, 4, f"spain_factor4_bar{i}"))
+
+    asyncio.run(run_sweep(jobs))
 
     # run_pipeline(chart_image2, 4, "cellphone_factor4_2")
+    # a blend of factors is one more job: jobs.append((chart_image1, "0.7*F2 + 0.3*F4", "spain_blend24_bar0"))
@@ -0,0 +1,76 @@
+import time
+import asyncio
+
+
+class HedgeStats:
+    """
+    What speculative candidates cost (requests sent, requests thrown away) against what they
+    saved (time to the first good candidate vs. the time a single candidate takes).
+    """
+
+    def __init__(self):
+        self.rounds = 0
+        self.wins = 0
+        self.candidates = 0
+        self.cancelled = 0
+        self.wait = 0.0
+        self.finished = 0
+        self.candidate_time = 0.0
+
+    def summary(self) -> str:
+        if not self.rounds:
+            return "Hedging: no rounds"
+        single = self.candidate_time / self.finished if self.finished else 0.0
+        return (f"Hedging: {self.wins}/{self.rounds} rounds won, {self.candidates} candidates "
+                f"({round(self.candidates / self.rounds, 1)} per round, {self.cancelled} cancelled). "
+                f"Mean wait {round(self.wait / self.rounds, 1)} s vs "
+                f"{round(single, 1)} s per finished candidate.")
+
+
+async def race(coros, stats=None):
+    """
+    Run candidate coroutines concurrently. Each returns (ok, value).
+    Returns (True, value) for the first candidate that is ok and cancels the rest,
+    or (False, [values or exceptions]) once every candidate has failed.
+    """
+    start = time.perf_counter()
+    # seconds until each candidate that was not cancelled finished
+    finished = []
+
+    async def timed(coro):
+        try:
+            result = await coro
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            finished.append(time.perf_counter() - start)
+            raise
+        finished.append(time.perf_counter() - start)
+        return result
+
+    tasks = [asyncio.ensure_future(timed(c)) for c in coros]
+    failures = []
+    ok = False
+    try:
+        for fut in asyncio.as_completed(tasks):
+            try:
+                ok, value = await fut
+            except Exception as e:
+                ok, value = False, e
+            if ok:
+                return True, value
+            failures.append(value)
+        return False, failures
+    finally:
+        pending = [t for t in tasks if not t.done()]
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if stats is not None:
+            stats.rounds += 1
+            stats.wins += ok
+            stats.candidates += len(tasks)
+            stats.cancelled += len(pending)
+            stats.finished += len(finished)
+            stats.candidate_time += sum(finished)
+            stats.wait += time.perf_counter() - start
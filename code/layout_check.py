@@ -0,0 +1,156 @@
+import sys
+import json
+import statistics
+from collections import defaultdict
+
+# two texts collide when their boxes share more than this fraction of the smaller box
+MIN_OVERLAP = 0.05
+# text may poke this many pixels past the image edge (antialiasing) before it counts as clipped
+CLIP_TOLERANCE_PX = 1.0
+# at most this many issues go into an error message; the summary line still counts them all
+MAX_REPORTED = 12
+
+
+class SpatialGrid:
+    """
+    Uniform grid over axis-aligned boxes [left, top, right, bottom]. Each box is filed under every
+    cell it touches, so only boxes that share a cell are ever compared.
+    """
+
+    def __init__(self, cell):
+        self.cell = max(float(cell), 1.0)
+        self.cells = defaultdict(list)
+
+    def _range(self, lo, hi):
+        return range(int(lo // self.cell), int(hi // self.cell) + 1)
+
+    def insert(self, key, box):
+        left, top, right, bottom = box
+        for cx in self._range(left, right):
+            for cy in self._range(top, bottom):
+                self.cells[cx, cy].append(key)
+
+    def query(self, box):
+        """
+        Keys of every box sharing a cell with `box` (a superset of the ones it overlaps).
+        """
+        left, top, right, bottom = box
+        keys = set()
+        for cx in self._range(left, right):
+            for cy in self._range(top, bottom):
+                keys.update(self.cells.get((cx, cy), ()))
+        return keys
+
+    def candidate_pairs(self):
+        pairs = set()
+        for keys in self.cells.values():
+            for i, a in enumerate(keys):
+                for b in keys[i + 1:]:
+                    pairs.add((a, b) if a < b else (b, a))
+        return pairs
+
+
+def _intersection(a, b):
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    return max(width, 0.0), max(height, 0.0)
+
+
+def _area(box):
+    return max(box[2] - box[0], 0.0) * max(box[3] - box[1], 0.0)
+
+
+def _slanted(entry):
+    return entry["rotation"] % 90 != 0
+
+
+def _ignore_pair(a, b):
+    # the axis-aligned boxes of slanted tick labels overlap their neighbours by construction
+    return a["role"] == b["role"] == "tick_label" and (_slanted(a) or _slanted(b))
+
+
+def find_overlaps(texts, min_overlap=MIN_OVERLAP):
+    """
+    Pairs of texts whose boxes overlap by more than `min_overlap` of the smaller box,
+    as (i, j, width_px, height_px).
+    """
+    boxes = [t["bbox"] for t in texts]
+    if len(boxes) < 2:
+        return []
+    # cells about one label across keep both the cells per box and the boxes per cell small
+    grid = SpatialGrid(statistics.median(max(b[2] - b[0], b[3] - b[1]) for b in boxes))
+    for i, box in enumerate(boxes):
+        grid.insert(i, box)
+
+    overlaps = []
+    for i, j in sorted(grid.candidate_pairs()):
+        if _ignore_pair(texts[i], texts[j]):
+            continue
+        width, height = _intersection(boxes[i], boxes[j])
+        smaller = min(_area(boxes[i]), _area(boxes[j]))
+        if smaller > 0 and width * height > min_overlap * smaller:
+            overlaps.append((i, j, round(width, 1), round(height, 1)))
+    return overlaps
+
+
+def find_clipped(texts, width_px, height_px, tolerance=CLIP_TOLERANCE_PX):
+    """
+    Texts reaching past the image edges, as (i, {edge: pixels outside}).
+    """
+    clipped = []
+    for i, t in enumerate(texts):
+        left, top, right, bottom = t["bbox"]
+        outside = {"left": -left, "top": -top, "right": right - width_px, "bottom": bottom - height_px}
+        outside = {edge: round(px, 1) for edge, px in outside.items() if px > tolerance}
+        if outside:
+            clipped.append((i, outside))
+    return clipped
+
+
+def _describe(t):
+    text = " ".join(t["text"].split())
+    return {"role": t["role"], "text": text if len(text) <= 40 else text[:39] + "…", "bbox": t["bbox"]}
+
+
+def check_layout(info) -> list:
+    """
+    All overlap and clipping issues in a text sidecar (see text_sidecar.collect_texts).
+    """
+    texts = info["texts"]
+    issues = [{"kind": "overlap", "a": _describe(texts[i]), "b": _describe(texts[j]), "overlap_px": [w, h]}
+              for i, j, w, h in find_overlaps(texts)]
+    issues += [{"kind": "clipped", "a": _describe(texts[i]), "outside_px": outside}
+               for i, outside in find_clipped(texts, info["width_px"], info["height_px"])]
+    return issues
+
+
+def format_issues(issues, info, limit=MAX_REPORTED) -> str:
+    """
+    A layout error for the recoder: one JSON object per issue, then a summary line shaped like the
+    last line of a traceback so error signatures group these runs together.
+    """
+    overlaps = sum(1 for i in issues if i["kind"] == "overlap")
+    clipped = len(issues) - overlaps
+    lines = [f"The chart rendered, but its text layout is broken. Text boxes below are in pixels of the "
+             f"{info['width_px']}x{info['height_px']} image as [left, top, right, bottom], origin top-left."]
+    lines += [json.dumps(issue, ensure_ascii=False) for issue in issues[:limit]]
+    if len(issues) > limit:
+        lines.append(f"... and {len(issues) - limit} more.")
+    lines.append("Move, wrap or shrink these texts so that no text overlaps other text or leaves the figure; "
+                 "keep the rest of the design unchanged.")
+    lines.append(f"LayoutError: {overlaps} overlapping text pairs, {clipped} clipped texts")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # python code/layout_check.py generated/*/*_text.json
+    failed = 0
+    for fname in sys.argv[1:]:
+        with open(fname, "r", encoding="utf-8") as f:
+            info = json.load(f)
+        issues = check_layout(info)
+        failed += bool(issues)
+        print(f"{fname}: {len(issues)} issues")
+        if issues:
+            print(format_issues(issues, info))
+    print(f"{failed}/{len(sys.argv) - 1} charts have layout issues.")
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import hashlib
+import contextvars
+
+# record: serve hits, call the API on a miss and store the answer
+# replay: serve hits only, a miss is an error (no API calls at all)
+# bypass: ignore the cache entirely
+CACHE_MODES = ("record", "replay", "bypass")
+# eviction goes down to this share of max_bytes, so a full cache is not walked on every store
+EVICT_TO = 0.9
+
+
+# Repeated sweep runs send byte-identical prompts on purpose, to sample different designs.
+# Pipelines set this to their output name so each run gets its own cache slot.
+CACHE_VARIANT = contextvars.ContextVar("CACHE_VARIANT", default="")
+
+
+class CacheMiss(KeyError):
+    pass
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache for LLM responses.
+    One JSON file per response, named by the hash of everything that went into the request.
+    Least recently used entries are evicted once the cache grows past max_bytes. The size is
+    kept as a running total, seeded from disk once, so a store only walks the cache when it
+    goes over the cap.
+    """
+
+    def __init__(self, path=".llm_cache", max_bytes=500 * 1024 * 1024, mode="record"):
+        if mode not in CACHE_MODES:
+            raise ValueError(
+                f"Unknown cache mode {mode!r}, expected one of {CACHE_MODES}")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = sum(size for _, size, _ in self._entries()) if mode == "record" else 0
+
+    def key(self, model, system_prompt, user_prompt, image_bytes=None, effort=None, variant=None) -> str:
+        if variant is None:
+            variant = CACHE_VARIANT.get()
+        h = hashlib.sha256()
+        for part in (model, system_prompt, user_prompt, effort, variant):
+            data = (part or "").encode("utf-8")
+            # length-prefix each part so ("ab", "c") and ("a", "bc") hash differently
+            h.update(len(data).to_bytes(8, "big"))
+            h.update(data)
+        image_bytes = image_bytes or b""
+        h.update(len(image_bytes).to_bytes(8, "big"))
+        h.update(image_bytes)
+        return h.hexdigest()
+
+    def _fname(self, key):
+        return os.path.join(self.path, key[:2], f"{key}.json")
+
+    def lookup(self, key):
+        """
+        Return the cached response text, or None if the caller should hit the API.
+        """
+        if self.mode == "bypass":
+            return None
+
+        fname = self._fname(key)
+        try:
+            with open(fname, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            if self.mode == "replay":
+                raise CacheMiss(key)
+            return None
+
+        # bump the access time so LRU eviction sees this entry as fresh
+        now = time.time()
+        os.utime(fname, (now, now))
+        self.hits += 1
+        return entry["text"]
+
+    def store(self, key, text, **meta):
+        if self.mode != "record":
+            return
+
+        fname = self._fname(key)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        try:
+            replaced = os.path.getsize(fname)
+        except FileNotFoundError:
+            replaced = 0
+        # write then rename so a crash mid-write never leaves a torn entry
+        tmp = f"{fname}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"text": text, "created": time.time(), **meta}, f)
+            size = f.tell()
+        os.replace(tmp, fname)
+        self.total_bytes += size - replaced
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        """
+        (mtime, size, path) of every entry on disk.
+        """
+        entries = []
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                fname = os.path.join(root, name)
+                st = os.stat(fname)
+                entries.append((st.st_mtime, st.st_size, fname))
+        return entries
+
+    def evict(self):
+        # other processes may share the directory, so re-count from disk rather than trust the total
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, fname in entries:
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+                os.remove(fname)
+                total -= size
+        self.total_bytes = total
+
+    def stats(self) -> str:
+        return f"cache {self.mode}: {self.hits} hits, {self.misses} misses"
+
+
+def cache_from_env() -> ResponseCache:
+    return ResponseCache(
+        path=os.getenv("LLM_CACHE_DIR", ".llm_cache"),
+        max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "500")) * 1024 * 1024),
+        mode=os.getenv("LLM_CACHE_MODE", "record"),
+    )
@@ -0,0 +1,195 @@
+import re
+import sys
+import json
+
+import numpy as np
+
+try:
+    import tiktoken
+except ImportError:  # token counts fall back to the ~4 characters per token estimate
+    tiktoken = None
+
+# variables whose |loading| is above this go into a design prompt
+THRESHOLD = 0.2
+
+# one term of a blend such as "0.7*F2 + 0.3*F4" (also "0.7 F2", "0.7·Factor 2", "-F1")
+TERM = re.compile(r"\s*([+-])?\s*(\d+(?:\.\d+)?|\.\d+)?\s*[*·]?\s*F(?:actor)?\s*(\d+)\s*", re.I)
+
+
+def parse_target(target) -> dict:
+    """
+    Normalize a factor target to {factor: weight}. Accepts 2, "2", "F2", {2: 0.7, 4: 0.3}
+    and "0.7*F2 + 0.3*F4". Raises ValueError for targets with no nonzero weight left, such as
+    "2*F2 - 2*F2".
+    """
+    if isinstance(target, dict):
+        weights = {int(k): float(v) for k, v in target.items()}
+    elif isinstance(target, (int, np.integer)) or str(target).strip().isdigit():
+        weights = {int(target): 1.0}
+    else:
+        weights, pos = {}, 0
+        text = str(target)
+        for m in TERM.finditer(text):
+            if m.start() != pos or (weights and not m.group(1)):
+                break
+            sign = -1.0 if m.group(1) == "-" else 1.0
+            factor = int(m.group(3))
+            weights[factor] = weights.get(factor, 0.0) + sign * float(m.group(2) or 1)
+            pos = m.end()
+        if pos != len(text) or not weights:
+            raise ValueError(f"Cannot read factor target {target!r}; use e.g. 2 or '0.7*F2 + 0.3*F4'")
+    weights = {k: w for k, w in sorted(weights.items()) if w != 0}
+    if not weights:
+        raise ValueError(f"Factor target {target!r} has no nonzero weight")
+    if min(weights) < 1:
+        raise ValueError(f"Factor target {target!r} names factor {min(weights)}; factors start at 1")
+    return weights
+
+
+def target_label(target):
+    """
+    The factor number for a single factor, else a canonical blend string like "0.7*F2+0.3*F4".
+    """
+    weights = parse_target(target)
+    if len(weights) == 1 and list(weights.values()) == [1.0]:
+        return next(iter(weights))
+    return "+".join(f"{w:g}*F{k}" for k, w in weights.items()).replace("+-", "-")
+
+
+class Loadings:
+    """
+    prompts/loadings.json compiled once into a (variables x factors) matrix. Filtered views for a
+    factor or a weighted blend of factors are built on first use and cached per threshold.
+    """
+
+    def __init__(self, loadings):
+        self.names = list(loadings)
+        self.categories = [loadings[n].get("Category") for n in self.names]
+        self.definitions = [loadings[n].get("Definition") for n in self.names]
+        self.n_factors = sum(1 for key in loadings[self.names[0]] if key.startswith("Factor "))
+        self.matrix = np.array([[loadings[n][f"Factor {k}"] for k in range(1, self.n_factors + 1)]
+                                for n in self.names], dtype=float)
+        self._views = {}
+        self._tables = {}
+
+    @classmethod
+    def from_file(cls, path="prompts/loadings.json"):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def weights(self, target) -> np.ndarray:
+        weights = parse_target(target)
+        for k in weights:
+            if not 1 <= k <= self.n_factors:
+                raise ValueError(f"Factor {k} is out of range 1..{self.n_factors}")
+        w = np.zeros(self.n_factors)
+        for k, v in weights.items():
+            w[k - 1] = v
+        return w
+
+    def blended(self, target) -> np.ndarray:
+        """
+        Loading of every variable on the target: one column for a factor, the weighted sum for a blend.
+        """
+        return self.matrix @ self.weights(target)
+
+    def view(self, target, threshold=THRESHOLD) -> dict:
+        """
+        {name: {"Category", "Definition", "Loading"}} for the variables loading above `threshold`
+        on the target, in file order. The same target and threshold return the same cached dict.
+        """
+        key = (target_label(target), threshold)
+        if key not in self._views:
+            values = self.blended(target)
+            self._views[key] = {
+                self.names[i]: {
+                    "Category": self.categories[i],
+                    "Definition": self.definitions[i],
+                    "Loading": round(float(values[i]), 3),
+                }
+                for i in np.flatnonzero(np.abs(values) > threshold)
+            }
+        return self._views[key]
+
+    def glossary(self, names=None) -> str:
+        """
+        One "- Name (Category): definition" line per variable, for all variables or just `names`.
+        """
+        wanted = set(self.names if names is None else names)
+        return "\n".join(f"- {n} ({c}): {d}" for n, c, d in zip(self.names, self.categories, self.definitions)
+                         if n in wanted)
+
+    def table(self, target, threshold=THRESHOLD) -> str:
+        """
+        The view as terse "Name: loading" lines, cached like the view.
+        """
+        key = (target_label(target), threshold)
+        if key not in self._tables:
+            self._tables[key] = "\n".join(f"{n}: {v['Loading']:g}" for n, v in self.view(target, threshold).items())
+        return self._tables[key]
+
+
+_ENCODING = []
+
+
+def count_tokens(text) -> int:
+    """
+    Tokens in `text` with the o200k tokenizer of the GPT-4o/GPT-5 family when tiktoken and its
+    vocabulary are available, else the rough estimate the rate limiter uses.
+    """
+    if not _ENCODING:
+        try:
+            _ENCODING.append(tiktoken.get_encoding("o200k_base"))
+        except Exception:  # not installed, or offline on first use
+            _ENCODING.append(None)
+    if _ENCODING[0] is None:
+        return len(text) // 4
+    return len(_ENCODING[0].encode(text))
+
+
+if __name__ == "__main__":
+    # python code/loadings.py [target ...]
+    # input tokens of a design-plan request as generate-chart.py builds it (system prompt, the
+    # shared DESIGN_PREFIX with the full glossary, then table and data), against the per-call
+    # layout it replaced, which glossed only the variables above THRESHOLD
+    import os
+    import importlib.util
+
+    # what a cached input token is billed at, as a share of an uncached one
+    CACHED_PRICE = 0.1
+    # providers only cache prompt prefixes from this many tokens up
+    MIN_CACHED_PREFIX = 1024
+
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(repo)
+    os.environ.update({"LLM_CACHE_MODE": "bypass", "MANIFEST_DB": ":memory:"})
+    spec = importlib.util.spec_from_file_location("generate_chart", os.path.join(repo, "code", "generate-chart.py"))
+    gc = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(gc)
+
+    loadings = gc.FACTOR_LOADINGS
+    targets = sys.argv[1:] or list(range(1, loadings.n_factors + 1))
+    count_tokens("")
+    method = "o200k_base" if _ENCODING[0] is not None else "estimated at 4 characters per token"
+    prefix = count_tokens(gc.DESIGN_PROMPT + gc.DESIGN_PREFIX)
+    print(f"Shared prefix (system prompt + DESIGN_PREFIX): {prefix} tokens ({method})")
+    print(f"{'target':<16}{'dataset':<11}{'variables':>10}{'per-call':>10}{'built':>8}{'increase':>10}")
+    increases = []
+    for target in targets:
+        view = loadings.view(target)
+        for dataset, data in (("spain", gc.chart_image1), ("cellphone", gc.chart_image2)):
+            prompt = gc.design_plan_prompt(data, target)
+            built = count_tokens(gc.DESIGN_PROMPT) + count_tokens(prompt)
+            before = count_tokens(gc.DESIGN_PROMPT) + count_tokens(
+                prompt.replace(loadings.glossary(), loadings.glossary(view), 1))
+            increases.append(built - before)
+            print(f"{str(target_label(target)):<16}{dataset:<11}{len(view):>10}{before:>10}{built:>8}{built - before:>+10}")
+
+    # a cached prefix costs CACHED_PRICE, so every hit saves (1 - CACHED_PRICE) * prefix tokens
+    saved_per_hit = (1 - CACHED_PRICE) * prefix if prefix >= MIN_CACHED_PREFIX else 0
+    for label, increase in (("smallest", min(increases)), ("largest", max(increases))):
+        if saved_per_hit:
+            rate = f"a prefix cache hit rate of at least {increase / saved_per_hit:.0%} to break even"
+        else:
+            rate = "no cache hits at all: the prefix is too short to be cached"
+        print(f"Per-call increase, {label}: {increase:+} tokens, which needs {rate}.")
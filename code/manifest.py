@@ -0,0 +1,211 @@
+import re
+import json
+import sqlite3
+import argparse
+import contextlib
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    sweep_id TEXT,
+    img_name TEXT,
+    dataset TEXT,
+    factor INTEGER,
+    run_index INTEGER,
+    model TEXT,
+    success INTEGER,
+    attempts INTEGER,
+    local_repairs INTEGER,
+    started REAL,
+    total_s REAL,
+    ttfr_s REAL,
+    plan_s REAL,
+    codegen_s REAL,
+    check_s REAL,
+    render_s REAL,
+    recode_s REAL,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    error_signatures TEXT,
+    plan_path TEXT,
+    code_path TEXT,
+    image_path TEXT,
+    plan_hash TEXT,
+    code_hash TEXT,
+    image_hash TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS errors (
+    run_id INTEGER REFERENCES runs(id),
+    attempt INTEGER,
+    signature TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_factor ON runs(factor);
+CREATE INDEX IF NOT EXISTS errors_signature ON errors(signature);
+"""
+
+STAGES = ("plan", "codegen", "check", "render", "recode")
+
+# columns added after the first version of the runs table; older manifests get them on open
+ADDED_COLUMNS = {
+    "png_bytes": "INTEGER",
+    "raw_png_bytes": "INTEGER",
+    "webp_bytes": "INTEGER",
+    "thumbnails": "TEXT",
+    "text_path": "TEXT",
+    "layout_issues": "INTEGER",
+    "factor_scores": "TEXT",
+    "factor_fit": "REAL",
+    "factor_rank": "INTEGER",
+    "cached_tokens": "INTEGER",
+}
+
+# output names look like spain_factor3_bar5 or cellphone_factor4_2
+NAME_PATTERN = re.compile(r"^(?P<dataset>.+?)_factor(?P<factor>\d+)_\D*(?P<index>\d+)$")
+
+
+def parse_img_name(img_name):
+    """
+    Split an output name into (dataset, factor, run index); unknown parts are None.
+    """
+    m = NAME_PATTERN.match(img_name)
+    if not m:
+        return img_name, None, None
+    return m["dataset"], int(m["factor"]), int(m["index"])
+
+
+def error_signature(error) -> str:
+    """
+    Reduce a traceback to its last line with numbers, quoted values and paths blanked out,
+    so the same failure in different scripts groups together.
+    """
+    lines = [line.strip() for line in (error or "").strip().splitlines() if line.strip()]
+    if not lines:
+        return ""
+    sig = lines[-1]
+    sig = re.sub(r"'[^']*'|\"[^\"]*\"", "'…'", sig)
+    sig = re.sub(r"\d+(\.\d+)?", "N", sig)
+    return sig[:200]
+
+
+class Manifest:
+    """
+    SQLite index of every pipeline run: one row in `runs` per pipeline, one row in `errors`
+    per failed attempt.
+    """
+
+    def __init__(self, path="manifest.sqlite"):
+        self.path = path
+        with contextlib.closing(sqlite3.connect(self.path)) as con, con:
+            con.executescript(SCHEMA)
+            existing = {row[1] for row in con.execute("PRAGMA table_info(runs)")}
+            for column, kind in ADDED_COLUMNS.items():
+                if column not in existing:
+                    con.execute(f"ALTER TABLE runs ADD COLUMN {column} {kind}")
+
+    def record(self, row, signatures=()):
+        """
+        Insert one run. `row` maps column names to values; `signatures` is a list of (attempt, signature).
+        """
+        row = dict(row, error_signatures=json.dumps([s for _, s in signatures]))
+        columns = ", ".join(row)
+        marks = ", ".join("?" for _ in row)
+        with contextlib.closing(sqlite3.connect(self.path)) as con, con:
+            cur = con.execute(f"INSERT INTO runs ({columns}) VALUES ({marks})", list(row.values()))
+            con.executemany("INSERT INTO errors (run_id, attempt, signature) VALUES (?, ?, ?)",
+                            [(cur.lastrowid, attempt, sig) for attempt, sig in signatures])
+            return cur.lastrowid
+
+    def query(self, sql, params=()):
+        with contextlib.closing(sqlite3.connect(self.path)) as con:
+            cur = con.execute(sql, params)
+            columns = [d[0] for d in cur.description or ()]
+            return columns, cur.fetchall()
+
+
+def percentile(values, q):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))], 3)
+
+
+# canned questions for the CLI
+QUERIES = {
+    "recode-rate": """
+        SELECT factor, COUNT(*) AS runs,
+               ROUND(AVG(attempts > 1), 3) AS recode_rate,
+               ROUND(AVG(success), 3) AS success_rate,
+               ROUND(AVG(attempts), 2) AS mean_attempts
+        FROM runs GROUP BY factor ORDER BY recode_rate DESC""",
+    "signatures": """
+        SELECT signature, COUNT(*) AS n, COUNT(DISTINCT run_id) AS runs
+        FROM errors GROUP BY signature ORDER BY n DESC LIMIT 20""",
+    "tokens": """
+        SELECT factor, SUM(input_tokens) AS input_tokens, SUM(output_tokens) AS output_tokens,
+               ROUND(AVG(input_tokens + output_tokens)) AS per_run
+        FROM runs GROUP BY factor""",
+    "prompt-cache": """
+        SELECT sweep_id, factor, SUM(input_tokens) AS input_tokens, SUM(cached_tokens) AS cached_tokens,
+               ROUND(1.0 * SUM(cached_tokens) / SUM(input_tokens), 3) AS hit_rate
+        FROM runs WHERE cached_tokens IS NOT NULL GROUP BY sweep_id, factor ORDER BY sweep_id DESC""",
+    "sizes": """
+        SELECT dataset, factor, COUNT(png_bytes) AS charts,
+               ROUND(SUM(raw_png_bytes) / 1048576.0, 2) AS raw_mib,
+               ROUND(SUM(png_bytes) / 1048576.0, 2) AS png_mib,
+               ROUND(SUM(webp_bytes) / 1048576.0, 2) AS webp_mib
+        FROM runs WHERE success = 1 GROUP BY dataset, factor""",
+    "layout": """
+        SELECT dataset, factor, COUNT(layout_issues) AS charts,
+               ROUND(AVG(layout_issues = 0), 3) AS clean_rate,
+               ROUND(AVG(layout_issues), 1) AS mean_issues
+        FROM runs WHERE success = 1 GROUP BY dataset, factor""",
+    "fit": """
+        SELECT factor, COUNT(factor_rank) AS scored,
+               ROUND(AVG(factor_rank = 1), 3) AS on_target,
+               ROUND(AVG(factor_fit), 2) AS mean_fit
+        FROM runs WHERE factor_rank IS NOT NULL GROUP BY factor""",
+    "recent": """
+        SELECT sweep_id, img_name, success, attempts, ROUND(total_s, 1) AS total_s, error_signatures
+        FROM runs ORDER BY id DESC LIMIT 20""",
+}
+
+
+def print_table(columns, rows):
+    cells = [[("" if v is None else str(v)) for v in row] for row in rows]
+    widths = [max([len(c)] + [len(r[i]) for r in cells]) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(r, widths)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the pipeline run manifest.")
+    parser.add_argument("--db", default="manifest.sqlite")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in QUERIES:
+        sub.add_parser(name)
+    p = sub.add_parser("percentile", help="pNN of a timing column, per factor")
+    p.add_argument("column", choices=[f"{s}_s" for s in STAGES] + ["total_s", "ttfr_s"])
+    p.add_argument("-q", type=float, default=95)
+    p = sub.add_parser("sql", help="run any SQL against the manifest")
+    p.add_argument("statement")
+    args = parser.parse_args(argv)
+
+    manifest = Manifest(args.db)
+    if args.command == "percentile":
+        _, rows = manifest.query(f"SELECT factor, {args.column} FROM runs")
+        by_factor = {}
+        for factor, value in rows:
+            by_factor.setdefault(factor, []).append(value)
+        print_table(["factor", "runs", f"p{args.q:g} {args.column}"],
+                    [(f, len(v), percentile(v, args.q)) for f, v in sorted(by_factor.items(), key=str)]
+                    + [("all", len(rows), percentile([v for _, v in rows], args.q))])
+    elif args.command == "sql":
+        print_table(*manifest.query(args.statement))
+    else:
+        print_table(*manifest.query(QUERIES[args.command]))
+
+
+if __name__ == "__main__":
+    main()
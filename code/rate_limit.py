@@ -0,0 +1,222 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import contextlib
+
+import openai
+
+# errors worth retrying after backing off; everything else goes straight to the caller
+RETRYABLE = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError,
+             openai.InternalServerError)
+
+
+def throttling(error) -> bool:
+    """
+    Whether an error means the server is overloaded: a 429 or a 5xx. Only those shrink the
+    concurrency limit; a dropped connection or a client-side timeout is retried as it is.
+    """
+    if isinstance(error, openai.RateLimitError):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+class TokenBucket:
+    """
+    Refills at `rate` units per second up to `capacity`. The level may go negative when
+    a request turns out to cost more than estimated; later requests then wait it off.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.stamp = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self, amount) -> float:
+        """
+        Take `amount` if it is available and return 0, otherwise return the seconds to wait.
+        """
+        self._refill()
+        # a single request bigger than the bucket only has to wait for a full bucket
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            self.level -= amount
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def adjust(self, amount):
+        self._refill()
+        self.level -= amount
+
+
+class RateLimiter:
+    """
+    Client-side limits shared by every responses.create call site:
+    a requests/minute bucket, an estimated tokens/minute bucket, and an AIMD concurrency
+    limit that halves on 429/5xx and grows by one slot per window of healthy responses.
+    Works from both threads and asyncio tasks.
+    """
+
+    def __init__(self, rpm=500, tpm=200_000, max_concurrency=16, min_concurrency=1,
+                 start_concurrency=4, max_attempts=6):
+        self.requests = TokenBucket(rpm / 60.0, max(1, rpm / 60.0 * 5))
+        self.tokens = TokenBucket(tpm / 60.0, tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(min(start_concurrency, max_concurrency))
+        self.max_attempts = max_attempts
+        self.in_flight = 0
+        self.latency_ewma = None
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def _try_start(self, est_tokens) -> float:
+        with self.lock:
+            if self.in_flight >= int(self.limit):
+                return 0.05
+            wait = max(self.requests.take(1), 0.0)
+            if wait:
+                return wait
+            wait = self.tokens.take(est_tokens)
+            if wait:
+                # give back the request slot we just took
+                self.requests.adjust(-1)
+                return wait
+            self.in_flight += 1
+            return 0.0
+
+    def _finish(self, latency=None, est_tokens=0, used_tokens=None, throttled=False):
+        with self.lock:
+            self.in_flight -= 1
+            if used_tokens is not None:
+                self.tokens.adjust(used_tokens - est_tokens)
+            if throttled:
+                # multiplicative decrease
+                self.throttled += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                return
+            if latency is None:
+                return
+            healthy = self.latency_ewma is None or latency <= 1.5 * self.latency_ewma
+            self.latency_ewma = latency if self.latency_ewma is None else (
+                0.8 * self.latency_ewma + 0.2 * latency)
+            if healthy:
+                # additive increase: about one extra slot per `limit` healthy responses
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+
+    @contextlib.asynccontextmanager
+    async def slot_async(self, est_tokens):
+        """
+        Hold one request slot for a block, e.g. while a streamed response is consumed.
+        Set `usage["tokens"]` inside the block to correct the token estimate.
+        """
+        while True:
+            wait = self._try_start(est_tokens)
+            if not wait:
+                break
+            await asyncio.sleep(wait)
+        usage = {"tokens": None}
+        start = time.monotonic()
+        try:
+            yield usage
+        except RETRYABLE as e:
+            self._finish(throttled=throttling(e))
+            raise
+        except BaseException:
+            self._finish()
+            raise
+        self._finish(time.monotonic() - start, est_tokens, usage["tokens"])
+
+    def backoff(self, error, attempt) -> float:
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return min(60.0, 2 ** attempt) * (0.5 + random.random())
+
+    def call(self, fn, est_tokens, **kwargs):
+        """
+        Run the blocking `fn(**kwargs)` (e.g. client.responses.create) under the limits.
+        """
+        for attempt in range(self.max_attempts):
+            while True:
+                wait = self._try_start(est_tokens)
+                if not wait:
+                    break
+                time.sleep(wait)
+            start = time.monotonic()
+            try:
+                response = fn(**kwargs)
+            except RETRYABLE as e:
+                self._finish(throttled=throttling(e))
+                if attempt == self.max_attempts - 1:
+                    raise
+                time.sleep(self.backoff(e, attempt))
+                continue
+            except Exception:
+                self._finish()
+                raise
+            self._finish(time.monotonic() - start, est_tokens, used_tokens(response))
+            return response
+
+    async def call_async(self, fn, est_tokens, **kwargs):
+        """
+        Await `fn(**kwargs)` (e.g. aclient.responses.create) under the limits.
+        """
+        for attempt in range(self.max_attempts):
+            while True:
+                wait = self._try_start(est_tokens)
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+            start = time.monotonic()
+            try:
+                response = await fn(**kwargs)
+            except RETRYABLE as e:
+                self._finish(throttled=throttling(e))
+                if attempt == self.max_attempts - 1:
+                    raise
+                await asyncio.sleep(self.backoff(e, attempt))
+                continue
+            except BaseException:
+                self._finish()
+                raise
+            self._finish(time.monotonic() - start, est_tokens, used_tokens(response))
+            return response
+
+    def stats(self) -> str:
+        return (f"rate limiter: concurrency limit {round(self.limit, 1)}, "
+                f"{self.throttled} throttled responses")
+
+
+def used_tokens(response):
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+def estimate_tokens(*texts, expected_output=4000) -> int:
+    """
+    Rough pre-flight estimate: ~4 characters per input token plus an output allowance
+    (reasoning models spend a lot of hidden output tokens).
+    """
+    return sum(len(t) for t in texts if t) // 4 + expected_output
+
+
+def limiter_from_env() -> RateLimiter:
+    return RateLimiter(
+        rpm=float(os.getenv("OPENAI_RPM", "500")),
+        tpm=float(os.getenv("OPENAI_TPM", "200000")),
+        max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "16")),
+    )
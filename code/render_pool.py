@@ -0,0 +1,428 @@
+import os
+import io
+import sys
+import time
+import queue
+import asyncio
+import builtins
+import threading
+import traceback
+import subprocess
+import multiprocessing
+from contextlib import redirect_stdout, redirect_stderr
+
+from text_sidecar import collect_texts, write_sidecar
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# seconds a single chart script may run before its worker is killed
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "120"))
+# resolution of the validation pass in two-tier rendering
+DRAFT_DPI = float(os.getenv("DRAFT_DPI", "50"))
+# how often a waiting render checks whether its caller has given up on it
+CANCEL_POLL_SECONDS = 0.1
+
+# figures a draft run asked to save, held until the parent says finalize or discard:
+# (figure, absolute target, savefig kwargs, rcParams at the time of the call)
+_PENDING_SAVES = []
+# targets the running draft has held back, and the ones the script then opened or stat'ed:
+# a script that reads its own output back needs a real single-pass render
+_HELD = set()
+_READ_BACK = set()
+
+
+def _note_read_back(path):
+    if not _HELD or not isinstance(path, (str, bytes, os.PathLike)):
+        return
+    target = os.path.abspath(os.fsdecode(path))
+    if target in _HELD:
+        _READ_BACK.add(target)
+
+
+def _audit(event, args):
+    # every Python-level open (builtins.open, io.open, os.open, PIL, imread) raises this event
+    if event == "open" and args:
+        _note_read_back(args[0])
+
+
+def _watching_stat(original):
+    """
+    os.stat wrapper for draft runs, so os.path.exists / getsize on a held-back output is noticed.
+    """
+    def stat(path, *args, **kwargs):
+        _note_read_back(path)
+        return original(path, *args, **kwargs)
+
+    return stat
+
+
+def _warm_up():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import numpy  # noqa: F401
+
+    # chart scripts may import the helpers that live next to this file; chart_labels keeps its
+    # text-metrics cache for the life of the worker
+    here = os.path.dirname(os.path.abspath(__file__))
+    if here not in sys.path:
+        sys.path.append(here)
+    import chart_labels  # noqa: F401
+
+    # draw once so the font cache and text layout machinery are loaded before the first job
+    fig = plt.figure()
+    fig.text(0.5, 0.5, "warm up")
+    fig.canvas.draw()
+    plt.close(fig)
+    # audit hooks cannot be removed, so this one stays and only looks at paths while a draft runs
+    sys.addaudithook(_audit)
+
+
+def _peak_rss_kb():
+    """
+    Peak resident set size of this worker so far (Linux reports ru_maxrss in KiB, macOS in bytes).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _save_options(kwargs):
+    """
+    The dpi and tight-bbox settings a savefig call ends up using.
+    """
+    import matplotlib
+
+    dpi = kwargs.get("dpi", matplotlib.rcParams["savefig.dpi"])
+    return {
+        "dpi": None if dpi == "figure" else dpi,
+        "bbox_inches": kwargs.get("bbox_inches", matplotlib.rcParams["savefig.bbox"]),
+        "pad_inches": kwargs.get("pad_inches"),
+    }
+
+
+def _write_sidecar(fig, fname, kwargs, texts):
+    # a sidecar problem should never fail a render that worked
+    try:
+        texts[os.path.abspath(fname)] = write_sidecar(fig, os.fspath(fname), **_save_options(kwargs))
+    except Exception:
+        traceback.print_exc()
+
+
+def _recording_savefig(original, saved, texts):
+    """
+    Figure.savefig wrapper for normal runs: save, write the *_text.json sidecar, add the
+    absolute path to `saved` and its text layout to `texts`.
+    """
+    def savefig(fig, fname, *args, **kwargs):
+        result = original(fig, fname, *args, **kwargs)
+        if isinstance(fname, (str, os.PathLike)):
+            _write_sidecar(fig, fname, kwargs, texts)
+            saved.append(os.path.abspath(fname))
+        return result
+
+    return savefig
+
+
+def _draft_savefig(original, texts):
+    """
+    A Figure.savefig stand-in for draft runs: draw at DRAFT_DPI into memory to prove the figure
+    renders, collect its text layout into `texts`, and remember the real call for _finalize.
+    Nothing is written, so the target is watched for the script reading it back.
+    """
+    import matplotlib
+
+    def savefig(fig, fname, *args, **kwargs):
+        if not isinstance(fname, (str, os.PathLike)):
+            return original(fig, fname, *args, **kwargs)
+        draft = dict(kwargs, dpi=DRAFT_DPI)
+        draft.setdefault("format", os.path.splitext(os.fspath(fname))[1][1:] or None)
+        if draft["format"] not in ("png", "jpg", "jpeg"):
+            # vector formats are cheap enough; validate them as a small png
+            draft["format"] = "png"
+        original(fig, io.BytesIO(), *args, **draft)
+        target = os.path.abspath(fname)
+        try:
+            # layout in the coordinates of the full-quality image
+            texts[target] = collect_texts(fig, **_save_options(kwargs))
+        except Exception:
+            traceback.print_exc()
+        _PENDING_SAVES.append((fig, target, args, kwargs, dict(matplotlib.rcParams)))
+        _HELD.add(target)
+
+    return savefig
+
+
+def _finalize(keep):
+    """
+    Do (or drop) the full-quality saves held back by the last draft run.
+    """
+    import matplotlib
+    from matplotlib.figure import Figure
+
+    stderr = io.StringIO()
+    returncode = 0
+    with redirect_stderr(stderr):
+        try:
+            for fig, fname, args, kwargs, rc in _PENDING_SAVES if keep else ():
+                with matplotlib.rc_context(rc):
+                    Figure.savefig(fig, fname, *args, **kwargs)
+                    # the draft already reported this layout
+                    _write_sidecar(fig, fname, kwargs, {})
+        except Exception as e:
+            traceback.print_exception(type(e), e, e.__traceback__)
+            returncode = 1
+        finally:
+            _PENDING_SAVES.clear()
+    return {"returncode": returncode, "stdout": "", "stderr": stderr.getvalue()}
+
+
+def _run_job(job):
+    """
+    Execute one chart script in a fresh namespace, the way `python <path>` would.
+    Every saved image gets a *_text.json sidecar describing its text artists, and the same
+    layout under its absolute path in the result's "texts".
+    With job["draft"] the script's savefig calls only draw at DRAFT_DPI; see _finalize. The
+    result's "read_back" lists held-back outputs the script opened or stat'ed afterwards.
+    """
+    import matplotlib
+    import matplotlib.pyplot as plt
+    from matplotlib.figure import Figure
+
+    path = job["path"]
+    stdout, stderr = io.StringIO(), io.StringIO()
+    namespace = {"__name__": "__main__", "__file__": path, "__builtins__": builtins}
+    returncode = 0
+
+    cwd = os.getcwd()
+    saved_argv, saved_path = sys.argv, list(sys.path)
+    sys.argv = [path]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    original_savefig, original_stat = Figure.savefig, os.stat
+    _PENDING_SAVES.clear()
+    texts, saved = {}, []
+    if job.get("draft"):
+        Figure.savefig = _draft_savefig(original_savefig, texts)
+        os.stat = _watching_stat(original_stat)
+    else:
+        Figure.savefig = _recording_savefig(original_savefig, saved, texts)
+
+    with redirect_stdout(stdout), redirect_stderr(stderr), matplotlib.rc_context():
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                source = f.read()
+            exec(compile(source, path, "exec"), namespace)
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                returncode = e.code or 0
+            else:
+                print(e.code, file=sys.stderr)
+                returncode = 1
+        except BaseException as e:
+            # skip this frame so the traceback starts at the chart script, like a subprocess would
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+            returncode = 1
+        finally:
+            Figure.savefig, os.stat = original_savefig, original_stat
+            read_back = sorted(_READ_BACK)
+            _HELD.clear()
+            _READ_BACK.clear()
+            plt.close("all")
+            os.chdir(cwd)
+            sys.argv, sys.path[:] = saved_argv, saved_path
+
+    return {"returncode": returncode, "stdout": stdout.getvalue(), "stderr": stderr.getvalue(),
+            "peak_rss_kb": _peak_rss_kb(), "saved": saved or [fname for _, fname, _, _, _ in _PENDING_SAVES],
+            "texts": texts, "read_back": read_back}
+
+
+def _run_spec_job(job):
+    """
+    Draw a JSON design spec with the built-in renderer instead of executing generated code.
+    """
+    import json
+    from design_spec import draw_spec
+
+    stderr = io.StringIO()
+    returncode = 0
+    texts = {}
+    with redirect_stderr(stderr):
+        try:
+            with open(job["path"], "r", encoding="utf-8") as f:
+                spec = json.load(f)
+            texts[os.path.abspath(job["image_fname"])] = draw_spec(spec, job["image_fname"])
+        except Exception as e:
+            traceback.print_exception(type(e), e, e.__traceback__)
+            returncode = 1
+    return {"returncode": returncode, "stdout": "", "stderr": stderr.getvalue(), "texts": texts}
+
+
+def _worker_main(conn):
+    _warm_up()
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        kind = job.get("kind")
+        if kind == "spec":
+            conn.send(_run_spec_job(job))
+        elif kind in ("finalize", "discard"):
+            conn.send(_finalize(kind == "finalize"))
+        else:
+            conn.send(_run_job(job))
+
+
+class RenderWorker:
+    """
+    One long-lived interpreter with matplotlib and numpy already imported.
+    """
+
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.proc.start()
+        child_conn.close()
+
+    def alive(self):
+        return self.proc.is_alive()
+
+    def run(self, job, timeout, cancel=None):
+        """
+        Run one job and wait for its result. The worker is killed when the job runs past
+        `timeout` seconds or the `cancel` event is set, since a running script cannot be stopped.
+        """
+        args = ["python", job["path"]]
+        try:
+            self.conn.send(job)
+            deadline = time.monotonic() + timeout
+            while not self.conn.poll(min(CANCEL_POLL_SECONDS, max(0.0, deadline - time.monotonic()))):
+                if cancel is not None and cancel.is_set():
+                    self.kill()
+                    return subprocess.CompletedProcess(args, -9, "", "Render cancelled.")
+                if time.monotonic() >= deadline:
+                    self.kill()
+                    return subprocess.CompletedProcess(
+                        args, -9, "", f"Chart script timed out after {timeout} seconds.")
+            result = self.conn.recv()
+        except (EOFError, BrokenPipeError, ConnectionResetError):
+            self.proc.join(1)
+            return subprocess.CompletedProcess(
+                args, self.proc.exitcode or -1, "",
+                f"Render worker died with exit code {self.proc.exitcode}.")
+        completed = subprocess.CompletedProcess(
+            args, result["returncode"], result["stdout"], result["stderr"])
+        completed.peak_rss_kb = result.get("peak_rss_kb")
+        completed.saved = result.get("saved", [])
+        completed.texts = result.get("texts", {})
+        completed.read_back = result.get("read_back", [])
+        return completed
+
+    def kill(self):
+        self.proc.kill()
+        self.proc.join()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.proc.join(5)
+        if self.proc.is_alive():
+            self.kill()
+
+
+class RenderPool:
+    """
+    A fixed-size pool of warm render workers.
+    Results come back as subprocess.CompletedProcess so callers can treat them like subprocess.run.
+    A worker that crashes, times out or is cancelled is replaced with a fresh one.
+    """
+
+    def __init__(self, size=2, timeout=RENDER_TIMEOUT):
+        self.ctx = multiprocessing.get_context("spawn")
+        self.timeout = timeout
+        self.size = size
+        self.idle = queue.Queue()
+        for _ in range(size):
+            self.idle.put(RenderWorker(self.ctx))
+
+    def run(self, code_fname, cancel=None, **options):
+        worker = self.idle.get()
+        try:
+            if cancel is not None and cancel.is_set():
+                return subprocess.CompletedProcess(["python", code_fname], -9, "", "Render cancelled.")
+            result = worker.run({"path": code_fname, **options}, self.timeout, cancel)
+        finally:
+            if not worker.alive():
+                worker = RenderWorker(self.ctx)
+            self.idle.put(worker)
+        return result
+
+    async def _cancellable(self, fn, *args, **kwargs):
+        """
+        Run a blocking pool call in a thread. Cancelling the caller kills the worker the call is
+        using, and waits for it to go, instead of leaving the worker busy on an abandoned render.
+        """
+        cancel = threading.Event()
+        call = asyncio.ensure_future(asyncio.to_thread(fn, *args, cancel=cancel, **kwargs))
+        try:
+            return await asyncio.shield(call)
+        except asyncio.CancelledError:
+            cancel.set()
+            await asyncio.wait([call])
+            raise
+
+    async def run_async(self, code_fname, **options):
+        return await self._cancellable(self.run, code_fname, **options)
+
+    def run_two_tier(self, code_fname, accept=None, cancel=None):
+        """
+        Run the script as a cheap DRAFT_DPI validation pass, then do the full-quality saves on the
+        same worker only if the run succeeded and accept(result) agrees; otherwise drop them.
+        result.saved lists the files the script asked for, result.texts their text layout, and
+        result.finalized says whether they were written.
+        A script that opens or checks its own output after saving it (to measure or post-process
+        it) cannot work from a held-back save, so it is run again as a normal single-pass render.
+        """
+        worker = self.idle.get()
+        try:
+            if cancel is not None and cancel.is_set():
+                return subprocess.CompletedProcess(["python", code_fname], -9, "", "Render cancelled.")
+            result = worker.run({"path": code_fname, "draft": True}, self.timeout, cancel)
+            result.finalized = False
+            if worker.alive() and result.read_back:
+                worker.run({"path": code_fname, "kind": "discard"}, self.timeout, cancel)
+                if worker.alive():
+                    read_back = result.read_back
+                    result = worker.run({"path": code_fname}, self.timeout, cancel)
+                    result.read_back = read_back
+                    result.finalized = result.returncode == 0 and (accept is None or accept(result))
+            elif worker.alive():
+                keep = result.returncode == 0 and (accept is None or accept(result))
+                final = worker.run({"path": code_fname, "kind": "finalize" if keep else "discard"},
+                                   self.timeout, cancel)
+                if keep and final.returncode != 0:
+                    result.returncode, result.stderr = final.returncode, result.stderr + final.stderr
+                result.finalized = keep and final.returncode == 0
+        finally:
+            if not worker.alive():
+                worker = RenderWorker(self.ctx)
+            self.idle.put(worker)
+        return result
+
+    async def run_two_tier_async(self, code_fname, accept=None):
+        return await self._cancellable(self.run_two_tier, code_fname, accept)
+
+    async def run_spec_async(self, spec_fname, image_fname):
+        return await self.run_async(spec_fname, kind="spec", image_fname=image_fname)
+
+    def close(self):
+        for _ in range(self.size):
+            self.idle.get().close()
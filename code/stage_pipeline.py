@@ -0,0 +1,136 @@
+import time
+import asyncio
+import traceback
+
+
+class Stage:
+    """
+    One step of a staged pipeline.
+    `fn(item)` is awaited by each of `workers` tasks and returns the name of the next stage, or None when the item is done.
+    """
+
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.busy = 0.0
+        self.items = 0
+        self.depth_samples = []
+        self.queue = None
+
+
+class StagedPipeline:
+    """
+    Runs items through stages connected by bounded asyncio queues, so network-bound and
+    CPU-bound stages work on different items at the same time.
+
+    `first` is the entry stage name, or a function of the item for items that arrive part-done.
+    Items may loop back to earlier stages (render -> recode -> check). To keep that from
+    deadlocking, at most `max_in_flight` items are admitted at once and every queue can
+    hold `max_in_flight` items, so a put never waits on a queue that cannot drain.
+
+    A stage that raises, or returns a stage name that does not exist, finishes the item and
+    goes to `on_error(stage name, item, exception)`; an exception from `on_done` goes there with
+    the stage name "done". Either way the worker keeps draining its queue, and every exception
+    is also kept in `errors` as (stage name, item, exception).
+    """
+
+    def __init__(self, stages, first, max_in_flight=8, sample_every=0.25, on_error=None, on_done=None):
+        self.stages = {s.name: s for s in stages}
+        self.first = first
+        self.max_in_flight = max_in_flight
+        self.sample_every = sample_every
+        self.on_error = on_error
+        self.on_done = on_done
+        self.errors = []
+        self.wall = 0.0
+
+    def _failed(self, stage_name, item, e):
+        self.errors.append((stage_name, item, e))
+        if self.on_error is None:
+            return
+        try:
+            self.on_error(stage_name, item, e)
+        except Exception:
+            traceback.print_exc()
+
+    async def _worker(self, stage, done, admitted, finished, total):
+        while True:
+            item = await stage.queue.get()
+            t0 = time.perf_counter()
+            try:
+                nxt = await stage.fn(item)
+            except Exception as e:
+                nxt = None
+                self._failed(stage.name, item, e)
+            finally:
+                stage.busy += time.perf_counter() - t0
+                stage.items += 1
+                stage.queue.task_done()
+            if nxt is not None and nxt not in self.stages:
+                self._failed(stage.name, item, KeyError(f"Stage {stage.name} sent the item to unknown stage {nxt!r}"))
+                nxt = None
+
+            if nxt is None:
+                if self.on_done is not None:
+                    try:
+                        self.on_done(item)
+                    except Exception as e:
+                        # a failing callback must not end the worker: its queue would never drain
+                        self._failed("done", item, e)
+                done.append(item)
+                admitted.release()
+                if len(done) == total:
+                    finished.set()
+            else:
+                await self.stages[nxt].queue.put(item)
+
+    async def _monitor(self):
+        while True:
+            for stage in self.stages.values():
+                stage.depth_samples.append(stage.queue.qsize())
+            await asyncio.sleep(self.sample_every)
+
+    async def run(self, items):
+        """
+        Push every item through the pipeline and return them in the order they finished.
+        """
+        for stage in self.stages.values():
+            stage.queue = asyncio.Queue(maxsize=self.max_in_flight)
+
+        items = list(items)
+        done = []
+        admitted = asyncio.Semaphore(self.max_in_flight)
+        finished = asyncio.Event()
+        if not items:
+            finished.set()
+        tasks = [asyncio.create_task(self._worker(stage, done, admitted, finished, len(items)))
+                 for stage in self.stages.values() for _ in range(stage.workers)]
+        monitor = asyncio.create_task(self._monitor())
+
+        start = time.perf_counter()
+        try:
+            for item in items:
+                await admitted.acquire()
+                first = self.first(item) if callable(self.first) else self.first
+                await self.stages[first].queue.put(item)
+            await finished.wait()
+        finally:
+            self.wall = time.perf_counter() - start
+            for task in tasks + [monitor]:
+                task.cancel()
+            await asyncio.gather(*tasks, monitor, return_exceptions=True)
+        return done
+
+    def report(self) -> str:
+        """
+        Per-stage utilization (busy time / worker time) and queue depth, to spot the bottleneck.
+        """
+        lines = [f"{'stage':<10}{'workers':>8}{'items':>7}{'busy s':>9}{'util':>7}{'q mean':>8}{'q max':>7}"]
+        for s in self.stages.values():
+            util = s.busy / (self.wall * s.workers) if self.wall > 0 else 0.0
+            mean_q = sum(s.depth_samples) / len(s.depth_samples) if s.depth_samples else 0.0
+            max_q = max(s.depth_samples, default=0)
+            lines.append(f"{s.name:<10}{s.workers:>8}{s.items:>7}{s.busy:>9.1f}"
+                         f"{util:>7.0%}{mean_q:>8.1f}{max_q:>7}")
+        return "\n".join(lines)
@@ -0,0 +1,54 @@
+import re
+
+OPEN_FENCE = re.compile(r"```[\w+-]*[ \t]*\n")
+CLOSE_FENCE = re.compile(r"^```[ \t]*$", re.MULTILINE)
+
+
+class IncompleteStream(Exception):
+    """
+    A streamed response that stopped before it was complete (failed, incomplete, or cut off).
+    """
+
+
+class FenceExtractor:
+    """
+    Incrementally pull the first fenced code block out of a streamed response.
+    Before an opening fence shows up the whole text is treated as code, so unfenced answers still work.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.code_start = None
+        self.code_end = None
+
+    def feed(self, delta):
+        self.text += delta
+        if self.code_start is None:
+            m = OPEN_FENCE.search(self.text)
+            if m:
+                self.code_start = m.end()
+        if self.code_start is not None and self.code_end is None:
+            m = CLOSE_FENCE.search(self.text, self.code_start)
+            if m:
+                self.code_end = m.start()
+
+    @property
+    def closed(self) -> bool:
+        return self.code_end is not None
+
+    def code(self) -> str:
+        """
+        The code received so far (everything inside the fence, if there is one).
+        """
+        if self.code_start is None:
+            return self.text
+        return self.text[self.code_start:self.code_end]
+
+    def complete_lines(self) -> str:
+        """
+        The code up to the last finished line, safe to scan without matching half a token.
+        """
+        code = self.code()
+        if self.closed:
+            return code
+        return code[:code.rfind("\n") + 1]
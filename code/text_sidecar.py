@@ -0,0 +1,237 @@
+import os
+import json
+
+# figure-level text above this height (as a fraction of the figure) is a title or subtitle,
+# below CAPTION_BELOW a caption
+HEADER_ABOVE = 0.85
+CAPTION_BELOW = 0.12
+# a scatter of hollow markers on at most this many points is a highlight ring, not data
+HIGHLIGHT_POINTS = 3
+
+
+def sidecar_fname(image_fname):
+    return f"{os.path.splitext(image_fname)[0]}_text.json"
+
+
+def _roles(fig):
+    """
+    Map id(Text) -> role for the text artists matplotlib gives a fixed job. Tick labels outside
+    the view limits are mapped to None because they are never drawn.
+    """
+    roles = {}
+    suptitle = getattr(fig, "_suptitle", None)
+    if suptitle is not None:
+        roles[id(suptitle)] = "title"
+    for name in ("_supxlabel", "_supylabel"):
+        label = getattr(fig, name, None)
+        if label is not None:
+            roles[id(label)] = "axis_label"
+
+    for ax in fig.axes:
+        for title in (ax.title, getattr(ax, "_left_title", None), getattr(ax, "_right_title", None)):
+            if title is not None:
+                roles[id(title)] = "title"
+        for axis in (ax.xaxis, ax.yaxis):
+            roles[id(axis.label)] = "axis_label"
+            roles[id(axis.get_offset_text())] = "tick_label"
+            lo, hi = sorted(axis.get_view_interval())
+            slack = (hi - lo) * 1e-6
+            for tick in axis.get_major_ticks() + axis.get_minor_ticks():
+                drawn = lo - slack <= tick.get_loc() <= hi + slack
+                for label in (tick.label1, tick.label2):
+                    roles[id(label)] = "tick_label" if drawn else None
+        for text in ax.texts:
+            roles[id(text)] = "annotation"
+
+    for legend in [ax.get_legend() for ax in fig.axes] + list(fig.legends):
+        if legend is None:
+            continue
+        for text in list(legend.get_texts()) + [legend.get_title()]:
+            roles[id(text)] = "legend"
+    return roles
+
+
+def _elements(fig):
+    """
+    Count what the reader sees besides text: arrows, circles, rectangles and straight lines the
+    script added for emphasis, images, and the data marks with their colors.
+    """
+    from matplotlib import patches
+    from matplotlib.colors import to_hex
+    from matplotlib.collections import PathCollection, LineCollection
+    from matplotlib.offsetbox import AnnotationBbox
+
+    counts = {"arrows": 0, "circles": 0, "rectangles": 0, "lines": 0, "images": len(fig.images), "marks": 0}
+    colors = set()
+
+    def mark(artist, n=1, color=None):
+        counts["marks"] += n
+        for c in ([color] if color is not None else []):
+            try:
+                colors.add(to_hex(c))
+            except (ValueError, TypeError):
+                pass
+
+    def emphasis(patch):
+        if isinstance(patch, (patches.FancyArrowPatch, patches.FancyArrow, patches.Arrow)):
+            counts["arrows"] += 1
+        elif isinstance(patch, (patches.Circle, patches.Ellipse)):
+            counts["circles"] += 1
+        elif isinstance(patch, (patches.Rectangle, patches.Polygon, patches.FancyBboxPatch)):
+            counts["rectangles"] += 1
+
+    for patch in fig.patches:
+        if patch.get_visible():
+            emphasis(patch)
+    for line in fig.lines:
+        if line.get_visible():
+            counts["lines"] += 1
+
+    for ax in fig.axes:
+        bars = {id(p) for container in ax.containers for p in getattr(container, "patches", ())}
+        for patch in ax.patches:
+            if not patch.get_visible():
+                continue
+            if id(patch) in bars or isinstance(patch, patches.Wedge):
+                mark(patch, color=patch.get_facecolor())
+            else:
+                emphasis(patch)
+        for line in ax.lines:
+            if not line.get_visible():
+                continue
+            n = len(line.get_xdata())
+            if n <= 2:
+                # reference lines and connectors, not series
+                counts["lines"] += 1
+            else:
+                mark(line, n, line.get_color())
+        for collection in ax.collections:
+            if not collection.get_visible():
+                continue
+            if isinstance(collection, PathCollection):
+                offsets = collection.get_offsets()
+                faces = collection.get_facecolor()
+                if len(offsets) <= HIGHLIGHT_POINTS and (len(faces) == 0 or not faces[:, 3].any()):
+                    # hollow markers on a point or two ring them for emphasis (design_spec circles
+                    # and most generated scripts draw them this way); they are not data
+                    counts["circles"] += len(offsets)
+                else:
+                    mark(collection, len(offsets), faces[0] if len(faces) else None)
+            elif isinstance(collection, LineCollection):
+                counts["lines"] += len(collection.get_segments())
+        counts["images"] += len(ax.images) + sum(isinstance(a, AnnotationBbox) for a in ax.artists)
+
+    counts["mark_colors"] = sorted(colors)[:24]
+    return counts
+
+
+def collect_texts(fig, dpi=None, bbox_inches=None, pad_inches=None) -> dict:
+    """
+    Describe every visible, non-empty Text/Annotation in a drawn figure: string, role, font size
+    and bbox in pixels of the image savefig(dpi=dpi, bbox_inches=...) produced (origin top-left),
+    plus counts of the figure's other visual elements.
+    """
+    if not hasattr(fig.canvas, "get_renderer"):
+        # pyplot.close() leaves a bare canvas behind; measure with Agg
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        FigureCanvasAgg(fig)
+    dpi = float(dpi or fig.dpi)
+    saved_dpi = fig.dpi
+    try:
+        # lay the figure out again at the save dpi: legends and tight bboxes are placed in pixels
+        fig.dpi = dpi
+        fig.draw_without_rendering()
+        renderer = fig.canvas.get_renderer()
+        return _describe(fig, renderer, bbox_inches, pad_inches)
+    finally:
+        fig.dpi = saved_dpi
+
+
+def _describe(fig, renderer, bbox_inches, pad_inches):
+    import matplotlib
+    from matplotlib.text import Text
+    from matplotlib.colors import to_hex
+
+    dpi = fig.dpi
+    if bbox_inches == "tight":
+        pad = pad_inches if isinstance(pad_inches, (int, float)) else matplotlib.rcParams["savefig.pad_inches"]
+        box = fig.get_tightbbox(renderer).padded(pad)
+        x0, y0, width, height = box.x0, box.y0, box.width, box.height
+    else:
+        x0 = y0 = 0.0
+        width, height = fig.get_size_inches()
+    height_px = height * dpi
+
+    roles = _roles(fig)
+    header = []
+    texts = []
+    for text in fig.findobj(Text):
+        role = roles.get(id(text), "text")
+        if role is None or not text.get_visible() or not text.get_text().strip():
+            continue
+        # Text's own extent: an Annotation's would include its arrow
+        ext = Text.get_window_extent(text, renderer)
+        if ext.width == 0 and ext.height == 0:
+            continue
+        if role == "text" and text in fig.texts:
+            # figure-level text: sort by where it sits
+            middle = (ext.y0 + ext.y1) / 2 / fig.bbox.height
+            role = "header" if middle > HEADER_ABOVE else "caption" if middle < CAPTION_BELOW else "annotation"
+        elif role == "text" and isinstance(text, matplotlib.text.Annotation):
+            role = "annotation"
+
+        left = ext.x0 - x0 * dpi
+        right = ext.x1 - x0 * dpi
+        top = height_px - (ext.y1 - y0 * dpi)
+        bottom = height_px - (ext.y0 - y0 * dpi)
+        entry = {
+            "text": text.get_text(),
+            "role": role,
+            "font_size_pt": round(text.get_fontsize(), 2),
+            "font_size_px": round(text.get_fontsize() * dpi / 72, 1),
+            "weight": str(text.get_fontweight()),
+            "color": to_hex(text.get_color()),
+            "rotation": round(text.get_rotation(), 1),
+            "bbox": [round(float(v), 1) for v in (left, top, right, bottom)],
+        }
+        arrow = getattr(text, "arrow_patch", None)
+        if arrow is not None and arrow.get_visible():
+            entry["arrow"] = True
+        box = text.get_bbox_patch()
+        if box is not None and box.get_visible():
+            entry["boxed"] = True
+        if role == "header":
+            header.append(entry)
+        texts.append(entry)
+
+    # the biggest header line is the title, the rest are subtitles
+    if header:
+        biggest = max(header, key=lambda e: e["font_size_pt"])
+        for entry in header:
+            entry["role"] = "title" if entry is biggest else "subtitle"
+
+    return {
+        "dpi": dpi,
+        "width_px": round(width * dpi),
+        "height_px": round(height_px),
+        "texts": texts,
+        "elements": _elements(fig),
+    }
+
+
+def write_sidecar(fig, image_fname, dpi=None, bbox_inches=None, pad_inches=None) -> dict:
+    info = collect_texts(fig, dpi, bbox_inches, pad_inches)
+    with open(sidecar_fname(image_fname), "w", encoding="utf-8") as f:
+        json.dump({"image": os.path.basename(image_fname), **info}, f, indent=1)
+    return info
+
+
+def read_sidecar(image_fname):
+    """
+    The sidecar written next to an image, or None if there is none.
+    """
+    try:
+        with open(sidecar_fname(image_fname), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
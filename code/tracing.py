@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import contextlib
+import contextvars
+
+_CURRENT = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, lane, parent, attrs):
+        self.name = name
+        self.lane = lane
+        self.parent = parent
+        self.attrs = attrs
+        self.span_id = uuid.uuid4().hex[:16]
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, key, amount):
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+
+def current_span():
+    return _CURRENT.get()
+
+
+class Tracer:
+    """
+    Writes one Chrome trace "complete" event per span to a JSONL file, with OpenTelemetry-style
+    trace/span/parent ids in the event args. Spans on the same lane (one per pipeline) share a
+    row in the viewer; nested spans inherit their parent's lane.
+    With no path every span is still created but nothing is written.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.trace_id = uuid.uuid4().hex
+        self.pid = os.getpid()
+        self.lanes = {}
+        self.lock = threading.Lock()
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    def _write(self, event):
+        self._file.write(json.dumps(event) + "\n")
+        self._file.flush()
+
+    def _lane_id(self, lane):
+        if lane not in self.lanes:
+            self.lanes[lane] = len(self.lanes) + 1
+            # name the row in the viewer
+            self._write({"name": "thread_name", "ph": "M", "pid": self.pid,
+                         "tid": self.lanes[lane], "args": {"name": lane}})
+        return self.lanes[lane]
+
+    @contextlib.contextmanager
+    def span(self, name, lane=None, **attrs):
+        parent = _CURRENT.get()
+        if lane is None:
+            lane = parent.lane if parent is not None else "main"
+        span = Span(name, lane, parent, attrs)
+        token = _CURRENT.set(span)
+        start = time.time()
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            _CURRENT.reset(token)
+            end = time.time()
+            if self._file is not None:
+                with self.lock:
+                    self._write({
+                        "name": name,
+                        "cat": name.split(".")[0],
+                        "ph": "X",
+                        "ts": round(start * 1e6),
+                        "dur": round((end - start) * 1e6),
+                        "pid": self.pid,
+                        "tid": self._lane_id(lane),
+                        "args": {
+                            **span.attrs,
+                            "trace_id": self.trace_id,
+                            "span_id": span.span_id,
+                            "parent_span_id": parent.span_id if parent is not None else None,
+                        },
+                    })
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def to_chrome_json(jsonl_path, json_path):
+    """
+    Wrap a span JSONL file as {"traceEvents": [...]} for chrome://tracing and Perfetto.
+    """
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return len(events)
+
+
+if __name__ == "__main__":
+    # python code/tracing.py .traces/<sweep>.jsonl trace.json
+    n = to_chrome_json(sys.argv[1], sys.argv[2])
+    print(f"Wrote {n} events to {sys.argv[2]}.")